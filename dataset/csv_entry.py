@@ -4,6 +4,7 @@ http://www.electronicwings.com
 '''
 import smbus
 import serial
+import struct
 import time
 import numpy as np
 import pandas as pd
@@ -23,11 +24,11 @@ CONFIG = 0x1A
 GYRO_CONFIG = 0x1B
 INT_ENABLE = 0x38
 ACCEL_XOUT_H = 0x3B
-ACCEL_YOUT_H = 0x3D
-ACCEL_ZOUT_H = 0x3F
-GYRO_XOUT_H = 0x43
-GYRO_YOUT_H = 0x45
-GYRO_ZOUT_H = 0x47
+GYRO_ZOUT_L = 0x48
+
+# ACCEL_XOUT_H..GYRO_ZOUT_L: accel xyz, temperature, gyro xyz as big-endian int16
+BLOCK_LENGTH = GYRO_ZOUT_L - ACCEL_XOUT_H + 1
+mpu_block = struct.Struct('>7h')
 
 def MPU_Init():
     try:
@@ -40,17 +41,15 @@ def MPU_Init():
         print(f"MPU6050 initialization failed: {e}")
         exit(1)
 
-def read_raw_data(addr):
+def read_raw_data():
+    """Read all six axes in one I2C block transaction so high/low bytes can't tear."""
     try:
-        high = bus.read_byte_data(Device_Address, addr)
-        low = bus.read_byte_data(Device_Address, addr + 1)
-        value = ((high << 8) | low)
-        if value > 32768:
-            value = value - 65536
-        return value
+        block = bus.read_i2c_block_data(Device_Address, ACCEL_XOUT_H, BLOCK_LENGTH)
+        acc_x, acc_y, acc_z, _temp, gyro_x, gyro_y, gyro_z = mpu_block.unpack(bytes(block))
+        return acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z
     except Exception as e:
         print(f"Error reading MPU6050 data: {e}")
-        return 0
+        return 0, 0, 0, 0, 0, 0
 
 bus = smbus.SMBus(1)
 Device_Address = 0x68
@@ -98,15 +97,8 @@ last_save_time = time.time()
 
 while True:
     try:
-        # Read Accelerometer raw value
-        acc_x = read_raw_data(ACCEL_XOUT_H)
-        acc_y = read_raw_data(ACCEL_YOUT_H)
-        acc_z = read_raw_data(ACCEL_ZOUT_H)
-        
-        # Read Gyroscope raw value
-        gyro_x = read_raw_data(GYRO_XOUT_H)
-        gyro_y = read_raw_data(GYRO_YOUT_H)
-        gyro_z = read_raw_data(GYRO_ZOUT_H)
+        # Read Accelerometer and Gyroscope raw values
+        acc_x, acc_y, acc_z, gyro_x, gyro_y, gyro_z = read_raw_data()
         
         # Convert to physical units
         Ax = acc_x / 16384.0
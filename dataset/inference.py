@@ -1,8 +1,19 @@
+import argparse
+import io
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import joblib
 
+# Columns the model was trained on, in training order
+feature_columns = ['Ax_mean', 'Ay_mean', 'Az_mean', 'Gx_mean', 'Gy_mean', 'Gz_mean',
+                   'Ax_var', 'Ay_var', 'Az_var', 'Gx_var', 'Gy_var', 'Gz_var',
+                   'co_mean', 'co2_mean', 'alcohol_mean', 'mean_bpm']
+
 def load_model_and_scaler(model_path='isolation_forest_model.pkl', scaler_path='scaler.pkl'):
     """Load the trained Isolation Forest model and scaler."""
     try:
@@ -71,7 +82,124 @@ def inference_pipeline(data_point, model_path='isolation_forest_model.pkl', scal
     print(f"Prediction: {label}, Anomaly Score: {score:.6f}")
     return label, score
 
+def score_chunk(chunk, model, scaler):
+    """Score a DataFrame of window rows in one call; returns (labels, scores)."""
+    # Same features as preprocess_data_point, picked by name so column order in the file doesn't matter
+    X = chunk[feature_columns].to_numpy(dtype=float)
+    missing = np.isnan(X)
+    if missing.any():
+        print(f"Warning: {int(missing.any(axis=1).sum())} rows with missing values. Filling with 0.")
+        X[missing] = 0
+    scores = model.decision_function(scaler.transform(X))
+    labels = np.where(scores < 0, 'Anomaly', 'Normal')
+    return labels, scores
+
+def output_path_for(path, output_dir=None):
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_dir or os.path.dirname(path), f"{stem}_scored{ext or '.csv'}")
+
+def score_file(path, model, scaler, chunksize=50000, output_dir=None):
+    """Score a whole CSV chunk by chunk and write it back with label and score columns.
+
+    If the file has no quote characters every line is one record, so the lines
+    are copied through untouched with the two columns appended (much faster
+    than having pandas format every float again); each must have as many
+    fields as the header. Files with quoted fields are parsed and written by
+    pandas. Returns (output path, rows scored, anomalies, seconds).
+    """
+    output = output_path_for(path, output_dir)
+    started = time.perf_counter()
+    rows = anomalies = 0
+    with open(path, newline='') as src:
+        quoted = any('"' in block for block in iter(lambda: src.read(1 << 20), ''))
+    if quoted:
+        with open(output, 'w', newline='') as dst:
+            for chunk in pd.read_csv(path, chunksize=chunksize, float_precision='round_trip'):
+                labels, scores = score_chunk(chunk, model, scaler)
+                chunk['label'] = labels
+                chunk['score'] = scores
+                chunk.to_csv(dst, header=rows == 0, index=False)
+                rows += len(chunk)
+                anomalies += int((labels == 'Anomaly').sum())
+        return output, rows, anomalies, time.perf_counter() - started
+    with open(path, newline='') as src, open(output, 'w', newline='') as dst:
+        header = src.readline().rstrip('\r\n')
+        names = header.split(',')
+        dst.write(f"{header},label,score\n")
+        line_number = 1
+        while True:
+            lines = [line.rstrip('\r\n') for line in itertools.islice(src, chunksize)]
+            if not lines:
+                break
+            for line in lines:
+                line_number += 1
+                if line and line.count(',') != len(names) - 1:
+                    raise ValueError(f"{path}:{line_number}: {line.count(',') + 1} fields, "
+                                     f"header has {len(names)}")
+            lines = [line for line in lines if line]
+            chunk = pd.read_csv(io.StringIO('\n'.join(lines)), names=names, header=None,
+                                float_precision='round_trip')
+            labels, scores = score_chunk(chunk, model, scaler)
+            dst.writelines(f"{line},{label},{score!r}\n"
+                           for line, label, score in zip(lines, labels, scores.tolist()))
+            rows += len(lines)
+            anomalies += int((labels == 'Anomaly').sum())
+    return output, rows, anomalies, time.perf_counter() - started
+
+_worker_model = None
+_worker_scaler = None
+
+def _init_worker(model, scaler):
+    # Each pool process receives the model once and reuses it for all its files
+    global _worker_model, _worker_scaler
+    _worker_model, _worker_scaler = model, scaler
+
+def _score_file_in_worker(path, chunksize, output_dir):
+    return score_file(path, _worker_model, _worker_scaler, chunksize, output_dir)
+
+def batch_inference(paths, model_path='isolation_forest_model.pkl', scaler_path='scaler.pkl',
+                    chunksize=50000, workers=1, output_dir=None):
+    """Score many CSV files, optionally one file per process, and report throughput."""
+    started = time.perf_counter()
+    skipped = [path for path in paths if os.path.splitext(path)[0].endswith('_scored')]
+    if skipped:
+        print(f"Skipping already scored files: {', '.join(skipped)}")
+        paths = [path for path in paths if path not in skipped]
+    model, scaler = load_model_and_scaler(model_path, scaler_path)
+    if model is None or scaler is None:
+        return []
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model, scaler)) as pool:
+            results = list(pool.map(_score_file_in_worker, paths,
+                                    [chunksize] * len(paths), [output_dir] * len(paths)))
+    else:
+        results = [score_file(path, model, scaler, chunksize, output_dir) for path in paths]
+    total_rows = 0
+    for output, rows, anomalies, seconds in results:
+        total_rows += rows
+        print(f"{output}: {rows} rows, {anomalies} anomalies, {rows / max(seconds, 1e-9):.0f} rows/sec")
+    elapsed = time.perf_counter() - started
+    print(f"Scored {total_rows} rows from {len(paths)} files in {elapsed:.2f} s "
+          f"({total_rows / max(elapsed, 1e-9):.0f} rows/sec)")
+    return results
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Score a sample data point, or whole CSV files in batch.")
+    ap.add_argument("csv", nargs="*", help="CSV files to score; results go to <name>_scored.csv")
+    ap.add_argument("--model", default="isolation_forest_model.pkl")
+    ap.add_argument("--scaler", default="scaler.pkl")
+    ap.add_argument("--chunksize", type=int, default=50000, help="rows read and scored per call")
+    ap.add_argument("--workers", type=int, default=1, help="process pool size, one file per task")
+    ap.add_argument("--output-dir", help="write scored files here instead of next to the inputs")
+    args = ap.parse_args()
+
+    if args.csv:
+        batch_inference(args.csv, args.model, args.scaler, args.chunksize, args.workers, args.output_dir)
+        exit(0)
+
     # Sample data point (mimicking final.csv structure)
     sample_data_point = {
         'timestamp': '2025-04-17 12:50:00',
@@ -104,4 +232,4 @@ if __name__ == "__main__":
     }
 
     # Run inference
-    label, score = inference_pipeline(sample_data_point)
\ No newline at end of file
+    label, score = inference_pipeline(sample_data_point, args.model, args.scaler)
\ No newline at end of file
@@ -1,14 +1,12 @@
-from scipy.spatial import distance as dist
 from imutils.video import VideoStream
-from imutils import face_utils
 from threading import Thread
 import numpy as np
 import argparse
-import imutils
 import time
 import dlib
 import cv2
 import os
+import sys
 import pygame
 import base64
 import google.generativeai as genai
@@ -118,41 +116,12 @@ def capture_and_detect_red_eye():
         time.sleep(5)
 
 
-def eye_aspect_ratio(eye):
-    A = dist.euclidean(eye[1], eye[5])
-    B = dist.euclidean(eye[2], eye[4])
+# EAR and lip distance come from the same module as the Pi inference loop
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'inference'))
+from landmarks import FaceMeasure, shape_into
 
-    C = dist.euclidean(eye[0], eye[3])
-
-    ear = (A + B) / (2.0 * C)
-
-    return ear
-
-def final_ear(shape):
-    (lStart, lEnd) = face_utils.FACIAL_LANDMARKS_IDXS["left_eye"]
-    (rStart, rEnd) = face_utils.FACIAL_LANDMARKS_IDXS["right_eye"]
-
-    leftEye = shape[lStart:lEnd]
-    rightEye = shape[rStart:rEnd]
-
-    leftEAR = eye_aspect_ratio(leftEye)
-    rightEAR = eye_aspect_ratio(rightEye)
-
-    ear = (leftEAR + rightEAR) / 2.0
-    return (ear, leftEye, rightEye)
-
-def lip_distance(shape):
-    top_lip = shape[50:53]
-    top_lip = np.concatenate((top_lip, shape[61:64]))
-
-    low_lip = shape[56:59]
-    low_lip = np.concatenate((low_lip, shape[65:68]))
-
-    top_mean = np.mean(top_lip, axis=0)
-    low_mean = np.mean(low_lip, axis=0)
-
-    distance = abs(top_mean[1] - low_mean[1])
-    return distance
+measure = FaceMeasure()
+shape = measure.shape
 
     
 ap = argparse.ArgumentParser()
@@ -175,27 +144,31 @@ vs = VideoStream(src=args["webcam"]).start()
 time.sleep(1.0)
 
 red_flag=False
+small = None
+gray = None
 while True:
     frame = vs.read()
     tmp_pic=frame
-    frame = imutils.resize(frame, width=450)
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if small is None:
+        # Same size imutils.resize(frame, width=450) gave; reused every frame
+        height, width = frame.shape[:2]
+        small = np.empty((int(height * (450 / float(width))), 450, 3), dtype=np.uint8)
+        gray = np.empty(small.shape[:2], dtype=np.uint8)
+    frame = cv2.resize(frame, (450, small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
     rects = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), flags=cv2.CASCADE_SCALE_IMAGE)
     
     for (x, y, w, h) in rects:
         rect = dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
-        shape = predictor(gray, rect)
-        shape = face_utils.shape_to_np(shape)
-        eye = final_ear(shape)
-        ear = eye[0]
-        leftEye = eye[1]
-        rightEye = eye[2]
-        distance = lip_distance(shape)
+        shape_into(predictor(gray, rect), shape)
+        ear, distance = measure.update()
+        leftEye = measure.left_eye
+        rightEye = measure.right_eye
         leftEyeHull = cv2.convexHull(leftEye)
         rightEyeHull = cv2.convexHull(rightEye)
         cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
         cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
-        lip = shape[48:60]
+        lip = measure.lip
         cv2.drawContours(frame, [lip], -1, (0, 255, 0), 1)
         
         # Start red-eye detection thread
@@ -0,0 +1,188 @@
+# camera.py
+import time
+import numpy as np
+import cv2
+
+# The lores stream is what detection and landmarks run on: about the 450 px
+# width the loop used to resize to (so pixel thresholds keep their meaning),
+# 16:9 like the main stream, and a multiple of 64 wide so the Y plane rows
+# have no padding
+LORES_SIZE = (448, 252)
+MAIN_SIZE = (1280, 720)
+
+
+def y_plane(yuv420, size):
+    """Grayscale view of the Y plane of an I420 frame; no pixels are copied."""
+    width, height = size
+    return yuv420[:height, :width]
+
+
+class PiCamera:
+    """Picamera2 with two streams from one sensor readout.
+
+    The lores stream is YUV420 at LORES_SIZE; its Y plane is the grayscale
+    detection frame. The BGR888 main stream stays on the ISP and is only copied
+    out when capture_full() asks for a snapshot.
+    """
+
+    def __init__(self, main_size=MAIN_SIZE, lores_size=LORES_SIZE):
+        from picamera2 import Picamera2, MappedArray
+
+        self._mapped_array = MappedArray
+        self.main_size = main_size
+        self.lores_size = lores_size
+        self.picam2 = Picamera2()
+        config = self.picam2.create_preview_configuration(
+            main={"size": main_size, "format": "BGR888"},
+            lores={"size": lores_size, "format": "YUV420"})
+        self.picam2.align_configuration(config)
+        self.picam2.configure(config)
+        # Alignment may have adjusted the lores size
+        self.lores_size = tuple(self.picam2.camera_config["lores"]["size"])
+        self.picam2.start()
+        time.sleep(2)
+
+    def capture_gray(self, out=None):
+        """Grayscale detection frame (lores Y plane).
+
+        With `out` (a (height, width) uint8 array) the Y plane is copied
+        straight from the camera buffer into it and no new array is made.
+        """
+        if out is None:
+            return y_plane(self.picam2.capture_array("lores"), self.lores_size)
+        request = self.picam2.capture_request()
+        try:
+            with self._mapped_array(request, "lores") as mapped:
+                np.copyto(out, y_plane(mapped.array, self.lores_size))
+        finally:
+            request.release()
+        return out
+
+    def capture_full(self):
+        """Full-resolution BGR snapshot from the main stream."""
+        return self.picam2.capture_array("main")
+
+    def close(self):
+        self.picam2.stop()
+
+
+class FakeCamera:
+    """Plays video files through the same interface as PiCamera, for off-device runs.
+
+    Each decoded frame is scaled to the main size, and the lores frame is
+    produced as real I420 (cv2.COLOR_BGR2YUV_I420) so capture_gray() exercises
+    the same Y plane path. With fps set, frames are paced to that rate;
+    loop=True starts over after the last file. capture_gray() returns None when
+    the files run out. Decoding, scaling and conversion reuse the same buffers
+    every frame.
+    """
+
+    def __init__(self, paths, main_size=MAIN_SIZE, lores_size=LORES_SIZE, fps=None, loop=False):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.main_size = main_size
+        self.lores_size = lores_size
+        self.fps = fps
+        self.loop = loop
+        self.frames = 0
+        self._index = 0
+        self._cap = None
+        self._main = None
+        self._decoded = None
+        self._scaled = None
+        self._lores = None
+        self._yuv = None
+        self._next_time = None
+
+    def _read(self):
+        while True:
+            if self._cap is None:
+                if self._index == len(self.paths):
+                    if not self.loop or not self.paths:
+                        return None
+                    self._index = 0
+                self._cap = cv2.VideoCapture(self.paths[self._index])
+                self._index += 1
+            ok, frame = self._cap.read(self._decoded)
+            if ok:
+                self._decoded = frame
+                return frame
+            self._cap.release()
+            self._cap = None
+
+    def capture_gray(self, out=None):
+        if self.fps:
+            now = time.monotonic()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + 1.0 / self.fps
+        frame = self._read()
+        if frame is None:
+            return None
+        if (frame.shape[1], frame.shape[0]) != self.main_size:
+            frame = self._scaled = cv2.resize(frame, self.main_size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+        self._main = frame
+        self.frames += 1
+        self._lores = cv2.resize(frame, self.lores_size, dst=self._lores, interpolation=cv2.INTER_AREA)
+        self._yuv = cv2.cvtColor(self._lores, cv2.COLOR_BGR2YUV_I420, dst=self._yuv)
+        gray = y_plane(self._yuv, self.lores_size)
+        if out is None:
+            return gray.copy()
+        np.copyto(out, gray)
+        return out
+
+    def capture_full(self):
+        return None if self._main is None else self._main.copy()
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+if __name__ == "__main__":
+    # Per-frame cost of getting the detection frame: the old path copies the
+    # 1280x720 BGR frame, resizes it to 450 wide and converts it to gray; the
+    # lores path hands over the Y plane of a 448x252 I420 buffer.
+    import argparse
+    import imutils
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("video", nargs="?", help="video file (default: synthetic frames)")
+    ap.add_argument("--frames", type=int, default=300)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.video:
+        camera = FakeCamera(args.video, loop=True)
+        full_frames = []
+        while len(full_frames) < 20:
+            camera.capture_gray()
+            full_frames.append(camera.capture_full())
+    else:
+        full_frames = [rng.integers(0, 256, (MAIN_SIZE[1], MAIN_SIZE[0], 3), dtype=np.uint8) for _ in range(20)]
+    lores_frames = [cv2.cvtColor(cv2.resize(f, LORES_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2YUV_I420)
+                    for f in full_frames]
+
+    start = time.perf_counter()
+    for i in range(args.frames):
+        # capture_array() hands back a copy of the buffer
+        frame = full_frames[i % len(full_frames)].copy()
+        frame = imutils.resize(frame, width=450)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    old_ms = (time.perf_counter() - start) / args.frames * 1000
+    old_bytes = (full_frames[0].nbytes * 2      # copy out of the camera buffer
+                 + full_frames[0].nbytes         # resize reads the full frame
+                 + frame.nbytes * 2              # resize writes, cvtColor reads
+                 + gray.nbytes)                  # cvtColor writes
+
+    start = time.perf_counter()
+    for i in range(args.frames):
+        buffer = lores_frames[i % len(lores_frames)].copy()
+        gray_lores = y_plane(buffer, LORES_SIZE)
+    new_ms = (time.perf_counter() - start) / args.frames * 1000
+    new_bytes = buffer.nbytes * 2                # copy out of the camera buffer only
+    assert gray_lores.base is buffer and gray_lores.flags['C_CONTIGUOUS']
+
+    print(f"1280x720 BGR + resize + cvtColor: {old_ms:.2f} ms/frame, ~{old_bytes / 1e6:.2f} MB moved, gray {gray.shape}")
+    print(f"lores YUV420 Y plane:           {new_ms:.2f} ms/frame, ~{new_bytes / 1e6:.2f} MB moved, gray {gray_lores.shape}")
+    print(f"memory traffic {old_bytes / new_bytes:.1f}x lower")
@@ -0,0 +1,166 @@
+# debug_stream.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import simplejpeg
+
+BOUNDARY = "frame"
+
+
+class DebugStream:
+    """Annotated frames as an MJPEG stream over HTTP, rendered only on demand.
+
+    Serves multipart/x-mixed-replace JPEGs at http://host:port/ (any path).
+    The vision loop asks wants_frame() before drawing anything: it is true
+    only while at least one client is connected and at most max_fps times a
+    second, so with nobody watching the loop stays headless and pays nothing
+    but that check. publish() encodes the frame once for all clients.
+
+    There is no authentication, so by default it only listens on localhost
+    (reach it over an SSH tunnel); pass host="0.0.0.0" to serve the
+    driver-facing camera to the vehicle's network on purpose.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080, max_fps=5.0, quality=70):
+        self.max_fps = max_fps
+        self.quality = quality
+        self.clients = 0
+        self.published = 0
+        self.bytes_sent = 0
+        self._jpeg = None
+        self._seq = 0
+        self._last_publish = None
+        self._cond = threading.Condition()
+        self._running = True
+        stream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                stream._serve(self.wfile)
+
+            def log_message(self, *a):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Debug stream on http://{host}:{self.port}/")
+
+    def _serve(self, wfile):
+        with self._cond:
+            self.clients += 1
+        seq = self._seq
+        try:
+            while self._running:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != seq or not self._running, timeout=1.0)
+                    if self._seq == seq:
+                        continue
+                    seq, jpeg = self._seq, self._jpeg
+                wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                            f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                wfile.flush()
+                self.bytes_sent += len(jpeg)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+    def wants_frame(self, now=None):
+        if not self.clients:
+            return False
+        now = time.monotonic() if now is None else now
+        return self._last_publish is None or now - self._last_publish >= 1.0 / self.max_fps
+
+    def publish(self, frame, now=None):
+        """JPEG-encode a BGR (or grayscale) frame and hand it to connected clients."""
+        self._last_publish = time.monotonic() if now is None else now
+        if frame.ndim == 2:
+            jpeg = simplejpeg.encode_jpeg(np.ascontiguousarray(frame)[..., None], quality=self.quality,
+                                          colorspace='GRAY')
+        else:
+            jpeg = simplejpeg.encode_jpeg(np.ascontiguousarray(frame), quality=self.quality, colorspace='BGR')
+        with self._cond:
+            self._jpeg = jpeg
+            self._seq += 1
+            self.published += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        return {'clients': self.clients, 'published': self.published, 'bytes_sent': self.bytes_sent}
+
+    def close(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    # Nothing is rendered until a client connects; then frames arrive at the
+    # capped rate however fast the loop publishes, and rendering stops again
+    # once it disconnects.
+    import argparse
+    import urllib.request
+    import cv2
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--max-fps", type=float, default=5.0)
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+
+    stream = DebugStream("127.0.0.1", args.port, max_fps=args.max_fps)
+    frame = np.zeros((252, 448, 3), dtype=np.uint8)
+    rendered = 0
+
+    def loop(seconds):
+        global rendered
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            if stream.wants_frame():
+                annotated = frame.copy()
+                cv2.putText(annotated, time.strftime("%H:%M:%S"), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                            (0, 0, 255), 2)
+                stream.publish(annotated)
+                rendered += 1
+            time.sleep(1.0 / 30)
+
+    loop(0.5)
+    assert rendered == 0
+    received = []
+
+    def client():
+        with urllib.request.urlopen(f"http://127.0.0.1:{stream.port}/") as response:
+            assert response.headers["Content-Type"].startswith("multipart/x-mixed-replace")
+            while len(received) < args.max_fps * args.seconds - 1:
+                line = response.readline()
+                if line.startswith(b"Content-Length:"):
+                    length = int(line.split(b":")[1])
+                    response.readline()
+                    received.append(cv2.imdecode(np.frombuffer(response.read(length), np.uint8), cv2.IMREAD_COLOR))
+
+    reader = threading.Thread(target=client, daemon=True)
+    reader.start()
+    while not stream.clients:
+        time.sleep(0.01)
+    loop(args.seconds)
+    reader.join(timeout=2.0)
+    connected_rendered = rendered
+    time.sleep(0.2)
+    loop(0.5)
+    print(f"rendered {connected_rendered} frames in {args.seconds:.1f} s with a client "
+          f"(cap {args.max_fps} fps, loop 30 fps), {len(received)} received {received[0].shape}, "
+          f"{rendered - connected_rendered} after it left; {stream.stats()}")
+    # A client that left is noticed on the next write that fails
+    assert connected_rendered <= args.max_fps * args.seconds + 1 and rendered - connected_rendered <= 2
+    stream.close()
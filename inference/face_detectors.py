@@ -0,0 +1,213 @@
+# face_detectors.py
+import cv2
+from camera import LORES_SIZE
+
+CASCADE_PATH = "haarcascade_frontalface_default.xml"
+DETECTORS = ('haar', 'haar-range', 'hog')
+# Driver's face side on the lores frame: about 37 px at 448 wide
+FACE_SIZE = (LORES_SIZE[0] // 15, LORES_SIZE[0] // 7)
+
+
+class FaceDetector:
+    """A face detection backend.
+
+    detect(gray, min_size, max_size) returns the faces in a grayscale frame as
+    a list of (x, y, w, h) ints. min_size/max_size narrow the backend's own
+    size range for one call (the tracker's ROI re-detection uses them); a
+    backend never reports faces outside its own range.
+    """
+
+    name = None
+
+    def __init__(self, min_size=(30, 30), max_size=None):
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def _range(self, min_size, max_size):
+        lo = self.min_size if min_size is None else (max(self.min_size[0], min_size[0]),
+                                                     max(self.min_size[1], min_size[1]))
+        hi = self.max_size
+        if max_size is not None:
+            hi = max_size if hi is None else (min(hi[0], max_size[0]), min(hi[1], max_size[1]))
+        return lo, hi
+
+    def detect(self, gray, min_size=None, max_size=None):
+        raise NotImplementedError
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade (a cv2.CascadeClassifier or the path to its XML)."""
+
+    name = 'haar'
+
+    def __init__(self, cascade=CASCADE_PATH, scale_factor=1.1, min_neighbors=5, min_size=(30, 30), max_size=None):
+        super().__init__(min_size, max_size)
+        self.cascade = cv2.CascadeClassifier(cascade) if isinstance(cascade, str) else cascade
+        if self.cascade.empty():
+            raise ValueError(f"Could not load the Haar cascade {cascade}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect(self, gray, min_size=None, max_size=None):
+        lo, hi = self._range(min_size, max_size)
+        kwargs = dict(scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=lo,
+                      flags=cv2.CASCADE_SCALE_IMAGE)
+        if hi is not None:
+            if hi[0] < lo[0] or hi[1] < lo[1]:
+                return []
+            kwargs['maxSize'] = hi
+        return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in self.cascade.detectMultiScale(gray, **kwargs)]
+
+
+class HaarRangeDetector(HaarDetector):
+    """Haar cascade scanning only the face sizes expected for the camera mount.
+
+    face_size is the (smallest, largest) face side in pixels of the frame the
+    detector is given; the default FACE_SIZE suits the lores frame. OpenCV
+    drops the pyramid levels outside that range, so the cost falls with how
+    tight the range is; faces outside it are missed.
+    """
+
+    name = 'haar-range'
+
+    def __init__(self, cascade=CASCADE_PATH, face_size=FACE_SIZE, scale_factor=1.1, min_neighbors=5):
+        lo, hi = face_size
+        super().__init__(cascade, scale_factor, min_neighbors, min_size=(lo, lo), max_size=(hi, hi))
+
+
+class HogDetector(FaceDetector):
+    """dlib's HOG + linear SVM frontal face detector.
+
+    Its window is 80x80, so faces the size of the driver's on the lores frame
+    need upsample >= 1 (each step doubles the image and roughly quadruples
+    the cost); upsample=0 only suits a much closer camera.
+    """
+
+    name = 'hog'
+
+    def __init__(self, upsample=1, min_size=(30, 30), max_size=None):
+        import dlib
+        super().__init__(min_size, max_size)
+        self.detector = dlib.get_frontal_face_detector()
+        self.upsample = upsample
+
+    def detect(self, gray, min_size=None, max_size=None):
+        lo, hi = self._range(min_size, max_size)
+        height, width = gray.shape[:2]
+        if not gray.flags['C_CONTIGUOUS']:
+            gray = gray.copy()
+        faces = []
+        for r in self.detector(gray, self.upsample):
+            x0, y0 = max(0, r.left()), max(0, r.top())
+            w, h = min(width, r.right() + 1) - x0, min(height, r.bottom() + 1) - y0
+            if w < lo[0] or h < lo[1] or (hi is not None and (w > hi[0] or h > hi[1])):
+                continue
+            faces.append((x0, y0, w, h))
+        return faces
+
+
+def make_detector(name, cascade_path=CASCADE_PATH, face_size=None, hog_upsample=1):
+    """Backend by name (one of DETECTORS), as chosen on the command line."""
+    if name == 'haar':
+        return HaarDetector(cascade_path)
+    if name == 'haar-range':
+        return HaarRangeDetector(cascade_path, face_size) if face_size else HaarRangeDetector(cascade_path)
+    if name == 'hog':
+        return HogDetector(upsample=hog_upsample)
+    raise ValueError(f"Unknown face detector: {name}")
+
+
+if __name__ == "__main__":
+    # Run each backend over a directory of recorded frames and report time per
+    # frame, CPU, and recall against hand-labeled boxes (IoU >= 0.5), to pick
+    # the fastest detector that is accurate enough for a camera mount.
+    # Labels: CSV with a file,x,y,w,h header, one row per face in original
+    # image pixels; frames without rows have no face.
+    import argparse
+    import csv
+    import os
+    import time
+    import numpy as np
+    from face_tracker import box_iou
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("frames", help="directory of recorded frames (.jpg/.png)")
+    ap.add_argument("--labels", help="labeled boxes CSV (default: FRAMES/labels.csv)")
+    ap.add_argument("--detectors", nargs="+", choices=DETECTORS, default=list(DETECTORS))
+    ap.add_argument("--cascade", default=CASCADE_PATH)
+    ap.add_argument("--face-size", type=int, nargs=2, metavar=("MIN", "MAX"),
+                    help="face side range in pixels after resizing, for haar-range (default: FACE_SIZE)")
+    ap.add_argument("--hog-upsample", type=int, default=1)
+    ap.add_argument("--width", type=int, default=LORES_SIZE[0],
+                    help="resize frames to this width first, like the lores stream (0: keep)")
+    ap.add_argument("--repeat", type=int, default=1, help="passes over the frames per detector")
+    ap.add_argument("--min-recall", type=float, default=0.9)
+    ap.add_argument("--write-labels", metavar="DETECTOR", choices=DETECTORS,
+                    help="write the labels CSV from this detector's output, to correct by hand, and exit")
+    args = ap.parse_args()
+
+    names = sorted(f for f in os.listdir(args.frames) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    frames = []
+    for name in names:
+        gray = cv2.imread(os.path.join(args.frames, name), cv2.IMREAD_GRAYSCALE)
+        scale = 1.0
+        if args.width and gray.shape[1] != args.width:
+            scale = args.width / float(gray.shape[1])
+            gray = cv2.resize(gray, (args.width, int(gray.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        frames.append((name, gray, scale))
+    labels_path = args.labels or os.path.join(args.frames, "labels.csv")
+    print(f"{len(frames)} frames from {args.frames}")
+
+    if args.write_labels:
+        detector = make_detector(args.write_labels, args.cascade, args.face_size, args.hog_upsample)
+        with open(labels_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "x", "y", "w", "h"])
+            for name, gray, scale in frames:
+                for box in detector.detect(gray):
+                    writer.writerow([name] + [int(round(v / scale)) for v in box])
+        print(f"Wrote {labels_path} from {args.write_labels}")
+        raise SystemExit
+
+    truth = {name: [] for name, _, _ in frames}
+    with open(labels_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["file"] in truth:
+                truth[row["file"]].append(tuple(float(row[k]) for k in ("x", "y", "w", "h")))
+    labeled = sum(len(boxes) for boxes in truth.values())
+    print(f"{labeled} labeled faces from {labels_path}")
+
+    results = []
+    for detector_name in args.detectors:
+        detector = make_detector(detector_name, args.cascade, args.face_size, args.hog_upsample)
+        detector.detect(frames[0][1])
+        times = []
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        for _ in range(args.repeat):
+            found = []
+            for name, gray, scale in frames:
+                started = time.perf_counter()
+                found.append(detector.detect(gray))
+                times.append(time.perf_counter() - started)
+        cpu = (time.process_time() - cpu_started) / (time.perf_counter() - wall_started)
+        hits = false_positives = 0
+        for (name, gray, scale), boxes in zip(frames, found):
+            unmatched = list(boxes)
+            for box in truth[name]:
+                box = tuple(v * scale for v in box)
+                ious = [box_iou(box, b) for b in unmatched]
+                if ious and max(ious) >= 0.5:
+                    unmatched.pop(int(np.argmax(ious)))
+                    hits += 1
+            false_positives += len(unmatched)
+        ms = np.array(times) * 1000.0
+        recall = hits / float(max(labeled, 1))
+        results.append((detector_name, ms.mean(), recall))
+        print(f"{detector_name:>10}: {ms.mean():6.1f} ms/frame (p95 {np.percentile(ms, 95):6.1f}), "
+              f"recall {recall:.3f}, {false_positives / float(len(frames)):.2f} false positives/frame, "
+              f"CPU {cpu:.0%}")
+    good = [r for r in results if r[2] >= args.min_recall]
+    if good:
+        print(f"Fastest with recall >= {args.min_recall}: {min(good, key=lambda r: r[1])[0]}")
+    else:
+        print(f"No detector reached recall {args.min_recall}")
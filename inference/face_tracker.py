@@ -0,0 +1,381 @@
+# face_tracker.py
+import time
+import numpy as np
+import cv2
+from face_detectors import DETECTORS, FaceDetector, HaarDetector, make_detector
+
+
+def _clip_box(box, shape):
+    x, y, w, h = box
+    height, width = shape[:2]
+    x0, y0 = max(0, int(round(x))), max(0, int(round(y)))
+    x1, y1 = min(width, int(round(x + w))), min(height, int(round(y + h)))
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+class DriverSelector:
+    """Picks the driver's face among the detections of a frame.
+
+    Each box scores
+        seat_weight * exp(-((cx - seat_x) / seat_sigma)^2 / 2)
+      + size_weight * area / largest area
+      + continuity_weight * IoU with the previous driver box
+    with cx the box centre as a fraction of the frame width (seat_x: where
+    the driver sits in the image). Only the best box is returned; the rest
+    are rejected after this arithmetic, so landmarks and alerts run once per
+    frame whatever the cascade returns. A previous driver box older than
+    forget_after empty calls stops counting.
+    """
+
+    def __init__(self, seat_x=0.5, seat_sigma=0.25, seat_weight=1.0, size_weight=1.0, continuity_weight=2.0,
+                 forget_after=30):
+        self.seat_x = seat_x
+        self.seat_sigma = seat_sigma
+        self.seat_weight = seat_weight
+        self.size_weight = size_weight
+        self.continuity_weight = continuity_weight
+        self.forget_after = forget_after
+        self.driver = None
+        self._missing = 0
+        self.calls = 0
+        self.multi_face_calls = 0
+        self.rejected = 0
+        self.switches = 0
+
+    def reset(self):
+        self.driver = None
+        self._missing = 0
+
+    def select(self, rects, frame_shape):
+        """The driver's (x, y, w, h) among rects, or None."""
+        self.calls += 1
+        if len(rects) == 0:
+            self._missing += 1
+            if self._missing > self.forget_after:
+                self.driver = None
+            return None
+        boxes = [tuple(int(v) for v in r) for r in rects]
+        best = boxes[0]
+        if len(boxes) > 1:
+            self.multi_face_calls += 1
+            self.rejected += len(boxes) - 1
+            width = float(frame_shape[1])
+            largest = float(max(w * h for _, _, w, h in boxes))
+            best_score = None
+            for box in boxes:
+                x, y, w, h = box
+                cx = (x + w / 2.0) / width
+                score = (self.seat_weight * np.exp(-0.5 * ((cx - self.seat_x) / self.seat_sigma) ** 2)
+                         + self.size_weight * w * h / largest)
+                if self.driver is not None:
+                    score += self.continuity_weight * box_iou(box, self.driver)
+                if best_score is None or score > best_score:
+                    best, best_score = box, score
+        if self.driver is not None and box_iou(best, self.driver) == 0.0:
+            self.switches += 1
+        self.driver = best
+        self._missing = 0
+        return best
+
+    def stats(self):
+        return {'calls': self.calls, 'multi_face_calls': self.multi_face_calls, 'rejected': self.rejected,
+                'switches': self.switches}
+
+
+class FaceTracker:
+    """Detect-then-track face localisation for the drowsiness loop.
+
+    The Haar cascade runs every detect_every frames; in between the face is
+    followed by a cheap tracker so only one face box is produced per frame:
+
+    - 'correlation': dlib.correlation_tracker, re-detecting early when its
+      peak-to-sidelobe ratio drops below min_psr;
+    - 'landmarks': the box is carried over from the previous frame's landmarks
+      (pass them to update_landmarks), keeping the Haar box's offset and size
+      relative to the landmark extent so the predictor sees the same framing.
+
+    Re-detection first searches a region around the last box, expanded by
+    search_margin of its size, with a matching size range; only if that fails
+    does it scan the full frame. With several faces the largest is tracked,
+    or the one `selector` (e.g. a DriverSelector) picks.
+
+    `detector` is a FaceDetector backend; a bare cv2.CascadeClassifier is
+    wrapped in a HaarDetector with scale_factor and min_neighbors.
+    """
+
+    def __init__(self, detector, mode='correlation', detect_every=10, min_psr=7.0, search_margin=0.5,
+                 scale_factor=1.1, min_neighbors=5, min_size=(30, 30), selector=None):
+        if mode not in ('correlation', 'landmarks'):
+            raise ValueError(f"Unknown tracking mode: {mode}")
+        if not isinstance(detector, FaceDetector):
+            detector = HaarDetector(detector, scale_factor, min_neighbors, min_size)
+        self.detector = detector
+        self.mode = mode
+        self.detect_every = detect_every
+        self.min_psr = min_psr
+        self.search_margin = search_margin
+        self.min_size = min_size
+        self.selector = selector
+        self.box = None
+        self.psr = None
+        self._since_detect = 0
+        self._tracker = None
+        self._landmark_offset = None
+        self.frames = 0
+        self.tracked = 0
+        self.roi_detections = 0
+        self.full_detections = 0
+        self.low_confidence = 0
+        self.lost = 0
+        self.detect_time = 0.0
+        self.track_time = 0.0
+
+    def reset(self):
+        self.box = None
+        self._tracker = None
+        self._landmark_offset = None
+
+    def _detect(self, gray, min_size, max_size=None, offset=(0, 0), frame_shape=None):
+        ox, oy = offset
+        rects = [(x + ox, y + oy, w, h) for (x, y, w, h) in self.detector.detect(gray, min_size, max_size)]
+        if self.selector is not None:
+            return self.selector.select(rects, frame_shape if frame_shape is not None else gray.shape)
+        if not rects:
+            return None
+        # The largest face is the one closest to the camera
+        return max(rects, key=lambda r: r[2] * r[3])
+
+    def _redetect(self, gray):
+        started = time.perf_counter()
+        found = None
+        if self.box is not None:
+            x, y, w, h = self.box
+            m = self.search_margin
+            roi = _clip_box((x - m * w, y - m * h, w * (1 + 2 * m), h * (1 + 2 * m)), gray.shape)
+            if roi is not None:
+                rx, ry, rw, rh = roi
+                size = max(w, h)
+                min_side = max(self.min_size[0], int(size * 0.6))
+                max_side = int(size * 1.6)
+                found = self._detect(gray[ry:ry + rh, rx:rx + rw], (min_side, min_side), (max_side, max_side),
+                                     offset=(rx, ry), frame_shape=gray.shape)
+                if found is not None:
+                    self.roi_detections += 1
+        if found is None:
+            found = self._detect(gray, self.min_size)
+            if found is not None:
+                self.full_detections += 1
+        self.detect_time += time.perf_counter() - started
+        self._since_detect = 0
+        self._landmark_offset = None
+        if found is None:
+            if self.box is not None:
+                self.lost += 1
+            self.reset()
+            return None
+        self.box = found
+        if self.mode == 'correlation':
+            import dlib
+            x, y, w, h = found
+            self._tracker = dlib.correlation_tracker()
+            self._tracker.start_track(gray, dlib.rectangle(x, y, x + w, y + h))
+        return found
+
+    def _track(self, gray):
+        if self.mode == 'landmarks':
+            # Box already moved by update_landmarks
+            return self.box
+        started = time.perf_counter()
+        self.psr = self._tracker.update(gray)
+        pos = self._tracker.get_position()
+        self.track_time += time.perf_counter() - started
+        if self.psr < self.min_psr:
+            self.low_confidence += 1
+            return None
+        return _clip_box((pos.left(), pos.top(), pos.width(), pos.height()), gray.shape)
+
+    def update(self, gray):
+        """Return the face boxes [(x, y, w, h)] for this grayscale frame (zero or one)."""
+        self.frames += 1
+        self._since_detect += 1
+        box = None
+        if self.box is not None and self._since_detect < self.detect_every:
+            box = self._track(gray)
+            if box is not None:
+                self.tracked += 1
+                self.box = box
+        if box is None:
+            box = self._redetect(gray)
+        return [] if box is None else [box]
+
+    def update_landmarks(self, shape):
+        """Feed the (68, 2) landmarks found in the current box ('landmarks' mode)."""
+        if self.mode != 'landmarks' or self.box is None:
+            return
+        x0, y0 = shape.min(axis=0)
+        x1, y1 = shape.max(axis=0)
+        lw, lh = max(x1 - x0, 1), max(y1 - y0, 1)
+        if self._landmark_offset is None:
+            # Relation between the detector's box and the landmark extent, fixed at detection
+            x, y, w, h = self.box
+            self._landmark_offset = ((x - x0) / lw, (y - y0) / lh, w / lw, h / lh)
+            return
+        ox, oy, sw, sh = self._landmark_offset
+        self.box = (int(round(x0 + ox * lw)), int(round(y0 + oy * lh)),
+                    int(round(sw * lw)), int(round(sh * lh)))
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'tracked': self.tracked,
+            'roi_detections': self.roi_detections,
+            'full_detections': self.full_detections,
+            'low_confidence': self.low_confidence,
+            'lost': self.lost,
+            'detect_ms': round(self.detect_time * 1000.0 / max(self.frames, 1), 2),
+            'track_ms': round(self.track_time * 1000.0 / max(self.frames, 1), 2),
+        }
+
+
+if __name__ == "__main__":
+    # Compare full-frame detection on every frame with detect-then-track on a
+    # recorded clip: localisation time per frame and, with the landmark model
+    # available, how far EAR and lip distance move.
+    import argparse
+    import imutils
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("video", help="video file to replay")
+    ap.add_argument("--cascade", default="haarcascade_frontalface_default.xml")
+    ap.add_argument("--detector", choices=DETECTORS, default="haar")
+    ap.add_argument("--predictor", default="shape_predictor_68_face_landmarks.dat")
+    ap.add_argument("--mode", choices=["correlation", "landmarks"], default="correlation")
+    ap.add_argument("--detect-every", type=int, default=10)
+    ap.add_argument("--max-frames", type=int, default=0)
+    ap.add_argument("--passenger", action="store_true",
+                    help="paste a larger copy of the face at passenger_x and compare driver selection")
+    ap.add_argument("--seat-x", type=float, default=0.4, help="driver's position across the frame")
+    ap.add_argument("--passenger-x", type=float, default=0.8)
+    args = ap.parse_args()
+
+    frames = []
+    cap = cv2.VideoCapture(args.video)
+    while True:
+        ok, frame = cap.read()
+        if not ok or (args.max_frames and len(frames) >= args.max_frames):
+            break
+        frames.append(cv2.cvtColor(imutils.resize(frame, width=450), cv2.COLOR_BGR2GRAY))
+    cap.release()
+    print(f"{len(frames)} frames from {args.video}")
+
+    detector = make_detector(args.detector, args.cascade)
+    predictor = None
+    try:
+        import dlib
+        from imutils import face_utils
+        from landmarks import FaceMeasure
+        predictor = dlib.shape_predictor(args.predictor)
+    except Exception as e:
+        print(f"Landmarks not compared ({e})")
+
+    def run(tracker):
+        measure = FaceMeasure()
+        outputs = []
+        started = time.perf_counter()
+        for gray in frames:
+            if tracker is None:
+                rects = FaceTracker(detector)._detect(gray, (30, 30))
+                rects = [] if rects is None else [rects]
+            else:
+                rects = tracker.update(gray)
+            value = None
+            if predictor is not None and rects:
+                x, y, w, h = rects[0]
+                shape = face_utils.shape_to_np(predictor(gray, dlib.rectangle(x, y, x + w, y + h)))
+                if tracker is not None:
+                    tracker.update_landmarks(shape)
+                value = measure.update(shape)
+            outputs.append((rects[0] if rects else None, value))
+        return outputs, (time.perf_counter() - started) / max(len(frames), 1) * 1000.0
+
+    baseline, base_ms = run(None)
+    tracker = FaceTracker(detector, mode=args.mode, detect_every=args.detect_every)
+    tracked, track_ms = run(tracker)
+    found = [sum(box is not None for box, _ in out) for out in (baseline, tracked)]
+    print(f"every frame: {base_ms:.1f} ms/frame, face in {found[0]} frames")
+    print(f"{args.mode} tracking: {track_ms:.1f} ms/frame, face in {found[1]} frames "
+          f"({base_ms / max(track_ms, 1e-9):.1f}x), {tracker.stats()}")
+    pairs = [(a[1], b[1]) for a, b in zip(baseline, tracked) if a[1] is not None and b[1] is not None]
+    if pairs:
+        diff = np.abs(np.array([a for a, _ in pairs]) - np.array([b for _, b in pairs]))
+        print(f"EAR abs diff: mean {diff[:, 0].mean():.4f}, max {diff[:, 0].max():.4f}; "
+              f"lip distance abs diff: mean {diff[:, 1].mean():.2f}, max {diff[:, 1].max():.2f}")
+
+    if args.passenger:
+        # Same clip with a passenger: the driver's face enlarged 1.3x and pasted
+        # at passenger_x, so the largest face is the wrong one. Landmarks for
+        # every detection vs the selected driver only, and how often the face
+        # used is the driver (IoU >= 0.5 with the box found on the clean frame).
+        scenes = []
+        for gray, (truth, _) in zip(frames, baseline):
+            if truth is None:
+                continue
+            x, y, w, h = truth
+            crop = _clip_box((x - 0.3 * w, y - 0.3 * h, 1.6 * w, 1.6 * h), gray.shape)
+            cx, cy, cw, ch = crop
+            patch = cv2.resize(gray[cy:cy + ch, cx:cx + cw], None, fx=1.3, fy=1.3)
+            px = min(int(args.passenger_x * gray.shape[1] - patch.shape[1] / 2), gray.shape[1] - patch.shape[1])
+            py = min(cy, gray.shape[0] - patch.shape[0])
+            if px < x + w or py < 0:
+                continue
+            scene = gray.copy()
+            scene[py:py + patch.shape[0], px:px + patch.shape[1]] = patch
+            scenes.append((scene, truth))
+        print(f"{len(scenes)} frames with a passenger")
+
+        def run_scenes(pick):
+            measure = FaceMeasure() if predictor is not None else None
+            driver = landmarks = 0
+            started = time.perf_counter()
+            for scene, truth in scenes:
+                rects = detector.detect(scene)
+                chosen = pick(rects, scene)
+                for (x, y, w, h) in chosen:
+                    if measure is not None:
+                        measure.update(face_utils.shape_to_np(predictor(scene, dlib.rectangle(
+                            int(x), int(y), int(x + w), int(y + h)))))
+                    landmarks += 1
+                driver += len(chosen) == 1 and box_iou(chosen[0], truth) >= 0.5
+            ms = (time.perf_counter() - started) / max(len(scenes), 1) * 1000.0
+            return ms, landmarks / max(len(scenes), 1), driver / max(len(scenes), 1)
+
+        selector = DriverSelector(seat_x=args.seat_x)
+        runs = [
+            ("all faces", lambda rects, scene: list(rects)),
+            ("largest", lambda rects, scene: [max(rects, key=lambda r: r[2] * r[3])] if len(rects) else []),
+            ("driver selector", lambda rects, scene: [b for b in [selector.select(rects, scene.shape)]
+                                                      if b is not None]),
+        ]
+        for name, pick in runs:
+            ms, per_frame, driver = run_scenes(pick)
+            print(f"{name}: {ms:.1f} ms/frame, {per_frame:.2f} landmark runs/frame, driver used in {driver:.0%}")
+        print(f"selector: {selector.stats()}")
+        tracker = FaceTracker(detector, mode=args.mode, detect_every=args.detect_every,
+                              selector=DriverSelector(seat_x=args.seat_x))
+        on_driver = sum(bool(b) and box_iou(b[0], truth) >= 0.5 for b, truth in
+                        ((tracker.update(scene), truth) for scene, truth in scenes))
+        print(f"{args.mode} tracking with the selector: driver in {on_driver / max(len(scenes), 1):.0%}, "
+              f"{tracker.selector.stats()}")
@@ -1,30 +1,21 @@
 # final.py
-from picamera2 import Picamera2
-from scipy.spatial import distance as dist
 from imutils.video import VideoStream
-from imutils import face_utils
 from threading import Thread
 import numpy as np
 import argparse
-import imutils
 import time
 import dlib
 import cv2
-import os
 import pygame
-import base64
-import google.generativeai as genai
 import queue
-import random
-
-# Initialize the camera
-picam2 = Picamera2()
-picam2.preview_configuration.main.size = (1280, 720)
-picam2.preview_configuration.main.format = "BGR888"
-picam2.preview_configuration.align()
-picam2.configure("preview")
-picam2.start()
-time.sleep(2)
+from face_tracker import DriverSelector, FaceTracker
+from face_detectors import DETECTORS, make_detector
+from camera import PiCamera, FakeCamera
+from temporal import TemporalEngine
+from vision_pipeline import VisionPipeline
+from debug_stream import DebugStream
+from landmarks import FaceMeasure, LandmarkFlow, shape_into
+from red_eye import RedEyeClient, RedEyePreClassifier, VerdictCache, dhash, eye_crop, encode_jpeg
 
 def sound_alarm(path, alert_queue):
     global alarm_status, alarm_status2, saying
@@ -45,12 +36,6 @@ def sound_alarm(path, alert_queue):
             print(f"Error playing sound: {e}")
         time.sleep(1)
 
-def encode_image(image_path):
-    if os.path.exists(image_path):
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode("utf-8")
-    return None
-
 LOG_FILE = "api_response_times.txt"
 
 def log_api_response_time(response_time):
@@ -59,160 +44,299 @@ def log_api_response_time(response_time):
         f.write(f"{timestamp} - API Response Time: {response_time:.3f} sec\n")
     print(f"📄 Logged API response time: {response_time:.3f} sec")
 
-def call_gemini_red_eye_detection(image_path, alert_queue):
-    api_key = ""
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-2.0-flash")
-
-    encoded_image = encode_image(image_path)
-    if not encoded_image:
-        print(f"Error encoding image: {image_path}")
-        return
-
-    input_content = [
-        {"text": "Detect any red-eye symptoms in this image. Respond with only 'yes' or 'no', strictly nothing else."},
-        {"mime_type": "image/jpg", "data": encoded_image}
-    ]
-
-    def safe_api_call(input_content, max_retries=5):
-        retries = 0
-        while retries < max_retries:
-            try:
-                response = model.generate_content(input_content)
-                print("API Response:", response.text)
-                if response.text.strip().lower() == 'yes':
-                    print("Red-eye detected, sending alert...")
-                    alert_queue.put(f"Red-eye detected at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                return response
-            except Exception as e:
-                print(f"API Error: {e}")
-                wait_time = (2 ** retries) + random.uniform(0, 1)
-                print(f"Retrying in {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-                retries += 1
-        print("Max retries reached. Skipping.")
-        return None
-
-    response = safe_api_call(input_content)
-    if response:
-        print("Response:", response.text)
-
-def capture_and_detect_red_eye(alert_queue):
-    global tmp_pic
+def capture_and_detect_red_eye(alert_queue, camera, latest, client=None, classifier=None, cache=None,
+                               interval=5.0, max_age=1.0):
+    """Every `interval` s check the eye region of a full-resolution snapshot for red eyes.
+
+    `latest` is filled by the vision loop with the newest landmarks ('shape',
+    in detection-frame coordinates, and their time 't'); without a recent face
+    nothing is checked. The local pre-classifier settles clear negatives; only
+    ambiguous or positive crops are JPEG-encoded in memory and sent to the
+    remote check, unless a near-identical crop (dHash within the cache radius)
+    got its verdict recently. If the remote check is unavailable (offline,
+    breaker open, budget spent) a local positive still raises the alert.
+    """
+    if client is None:
+        client = RedEyeClient()
+    if classifier is None:
+        classifier = RedEyePreClassifier()
+    if cache is None:
+        cache = VerdictCache()
+    while True:
+        time.sleep(interval)
+        shape, t = latest.get('shape'), latest.get('t')
+        if shape is None or time.monotonic() - t > max_age:
+            continue
+        # Full-resolution snapshot from the main stream, only when needed
+        snapshot = camera.capture_full()
+        if snapshot is None:
+            continue
+        lores_w, lores_h = camera.lores_size
+        crop, eyes = eye_crop(snapshot, shape, (snapshot.shape[1] / lores_w, snapshot.shape[0] / lores_h))
+        if crop is None:
+            continue
+        local = classifier.score(crop, eyes)
+        if local.decision == 'negative':
+            print(f"Red-eye: local negative (confidence {local.confidence:.2f}, red ratio {local.red_ratio:.3f})")
+            continue
+        key = dhash(crop)
+        remote = cache.get(key)
+        if remote is not None:
+            source = f"cached {'yes' if remote else 'no'}"
+        else:
+            jpeg = encode_jpeg(crop)
+            remote = client.check(jpeg)
+            if remote is not None:
+                cache.put(key, remote)
+                source = f"remote {'yes' if remote else 'no'} in {client.last_latency:.3f} s, {len(jpeg)} bytes"
+        if remote is None:
+            detected, source = local.decision == 'positive', "local only, remote unavailable"
+        else:
+            detected = remote
+        print(f"Red-eye: local {local.decision} (confidence {local.confidence:.2f}, "
+              f"red ratio {local.red_ratio:.3f}) -> {source}, cache {cache.stats()}")
+        if detected:
+            print("Red-eye detected, sending alert...")
+            alert_queue.put(f"Red-eye detected at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+def draw_overlay(frame, shape, ear, distance, state):
+    leftEye = shape[42:48]
+    rightEye = shape[36:42]
+    leftEyeHull = cv2.convexHull(leftEye)
+    rightEyeHull = cv2.convexHull(rightEye)
+    cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
+    cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
+    lip = shape[48:60]
+    cv2.drawContours(frame, [lip], -1, (0, 255, 0), 1)
+    if state.drowsy:
+        cv2.putText(frame, "DROWSINESS ALERT!", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    if state.yawning:
+        cv2.putText(frame, "Yawn Alert", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    cv2.putText(frame, "EAR: {:.2f}".format(ear), (300, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    cv2.putText(frame, "YAWN: {:.2f}".format(distance), (300, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+    cv2.putText(frame, "PERCLOS: {:.2f}".format(state.perclos), (300, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+def detect_landmarks(camera, detector, predictor, face_tracker, landmark_flow=None, selector=None, max_fps=None):
+    """Yield (t, gray, [68x2 landmarks]) per frame, detecting in this thread.
+
+    With a LandmarkFlow (only used together with a face_tracker, which gives
+    one face) landmarks are carried between frames by optical flow and the
+    predictor runs only when the flow needs a refresh. Without a face_tracker,
+    `selector` keeps only the driver among the detected faces. With max_fps
+    set, frames are taken no more often than that (to leave CPU to the rest
+    of the Pi); otherwise as fast as detection allows.
+
+    The frame, the landmark arrays and the list are the same objects every
+    frame, refilled in place, so nothing is allocated per frame once running;
+    use them before asking for the next frame.
+    """
+    gray = None
+    landmarks = []
+    shapes = []
+    next_frame = time.monotonic()
     while True:
-        if tmp_pic is not None:
-            filename = "red_eye_check.jpg"
-            cv2.imwrite(filename, tmp_pic)
-            print("📸 Image captured for red-eye detection")
-            call_gemini_red_eye_detection(filename, alert_queue)
-        time.sleep(5)
-
-def eye_aspect_ratio(eye):
-    A = dist.euclidean(eye[1], eye[5])
-    B = dist.euclidean(eye[2], eye[4])
-    C = dist.euclidean(eye[0], eye[3])
-    ear = (A + B) / (2.0 * C)
-    return ear
-
-def final_ear(shape):
-    (lStart, lEnd) = face_utils.FACIAL_LANDMARKS_IDXS["left_eye"]
-    (rStart, rEnd) = face_utils.FACIAL_LANDMARKS_IDXS["right_eye"]
-    leftEye = shape[lStart:lEnd]
-    rightEye = shape[rStart:rEnd]
-    leftEAR = eye_aspect_ratio(leftEye)
-    rightEAR = eye_aspect_ratio(rightEye)
-    ear = (leftEAR + rightEAR) / 2.0
-    return (ear, leftEye, rightEye)
-
-def lip_distance(shape):
-    top_lip = shape[50:53]
-    top_lip = np.concatenate((top_lip, shape[61:64]))
-    low_lip = shape[56:59]
-    low_lip = np.concatenate((low_lip, shape[65:68]))
-    top_mean = np.mean(top_lip, axis=0)
-    low_mean = np.mean(low_lip, axis=0)
-    distance = abs(top_mean[1] - low_mean[1])
-    return distance
-
-def run_drowsiness_detection(alert_queue, alarm_path="Alert.wav"):
+        if max_fps:
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_frame = max(next_frame, time.monotonic() - 1.0 / max_fps) + 1.0 / max_fps
+        # Lores Y plane: already grayscale at detection size
+        gray = camera.capture_gray(out=gray)
+        if gray is None:
+            return
+        t = time.monotonic()
+        if face_tracker is not None:
+            rects = face_tracker.update(gray)
+        else:
+            rects = detector.detect(gray)
+            if selector is not None:
+                driver = selector.select(rects, gray.shape)
+                rects = [] if driver is None else [driver]
+
+        del shapes[:]
+        if landmark_flow is not None and not len(rects):
+            landmark_flow.reset()
+        for i, (x, y, w, h) in enumerate(rects):
+            if i == len(landmarks):
+                landmarks.append(np.zeros((68, 2), dtype=np.int32))
+            if landmark_flow is not None:
+                shape = landmark_flow.update(gray, (x, y, w, h), t, landmarks[i])
+            else:
+                rect = dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
+                shape = shape_into(predictor(gray, rect), landmarks[i])
+            if face_tracker is not None:
+                face_tracker.update_landmarks(shape)
+            shapes.append(shape)
+        yield t, gray, shapes
+
+def run_drowsiness_detection(alert_queue, alarm_path="Alert.wav", track_mode="correlation", detect_every=10,
+                             camera=None, pipeline=False, debug_port=None, debug_host="127.0.0.1",
+                             landmark_flow=False, seat_x=0.5, detector="haar", face_size=None, hog_upsample=1, max_fps=None):
+    """Landmark-based drowsiness/yawn detection on the Pi camera.
+
+    Frames come from camera.capture_gray() (PiCamera by default, FakeCamera to
+    replay video files); the loop ends when a finite camera runs out.
+
+    With track_mode set ('correlation' or 'landmarks') the Haar cascade only runs
+    every detect_every frames and the face is tracked in between (see
+    FaceTracker); track_mode=None detects on every frame as before. The
+    detector backend is chosen by name (see face_detectors.make_detector;
+    face_size is the (min, max) face side for 'haar-range', hog_upsample the
+    image doublings for 'hog'). max_fps caps the in-thread loop's frame rate;
+    by default it runs as fast as detection allows.
+
+    landmark_flow=True (needs track_mode) follows the 68 landmarks with
+    optical flow and only re-runs the dlib predictor when the flow's error,
+    spread, age or an EAR near the threshold says so (see LandmarkFlow). It is
+    not offered on the command line: the eyes-open/closed decision agrees
+    with the every-frame predictor on only ~93% of frames of the test clip
+    (python landmarks.py <clip>).
+
+    Only the driver's face is processed: among several detections the one
+    nearest the seat position seat_x (fraction of the frame width), large and
+    overlapping the previous driver box wins (see DriverSelector); passengers
+    and false detections are dropped before landmarks.
+
+    With pipeline=True detection and landmarks run in their own process on
+    the newest captured frame (see VisionPipeline) while this thread only
+    keeps the alert logic.
+
+    Nothing is drawn by default. With debug_port set, an annotated MJPEG
+    stream is served on that port of debug_host, localhost unless chosen
+    otherwise (see DebugStream); overlays are rendered only while a client is
+    connected, at its capped rate.
+
+    Alerts are decided on time, not frame counts (see TemporalEngine): eyes
+    closed for EYE_CLOSED_SECONDS or a high PERCLOS raise the drowsiness alarm,
+    a mouth open for YAWN_SECONDS the yawn alarm.
+    """
     print("Drowsiness detection started")
-    global alarm_status, alarm_status2, saying, tmp_pic
+    global alarm_status, alarm_status2, saying
     EYE_AR_THRESH = 0.30
-    EYE_AR_CONSEC_FRAMES = 30*3 
+    EYE_CLOSED_SECONDS = 3.0
     YAWN_THRESH = 20
+    YAWN_SECONDS = 1.0
     alarm_status = False
     alarm_status2 = False
     saying = False
-    COUNTER = 0
+    temporal = TemporalEngine(ear_thresh=EYE_AR_THRESH, yawn_thresh=YAWN_THRESH,
+                              closed_seconds=EYE_CLOSED_SECONDS, yawn_seconds=YAWN_SECONDS)
 
-    detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
-    predictor = dlib.shape_predictor('shape_predictor_68_face_landmarks.dat')
+    if camera is None:
+        camera = PiCamera()
+    vision = None
+    face_tracker = None
+    flow = None
+    selector = None
+    debug = DebugStream(debug_host, debug_port) if debug_port is not None else None
+    if pipeline:
+        vision = VisionPipeline(camera, track_mode=track_mode, detect_every=detect_every,
+                                landmark_flow=landmark_flow, seat_x=seat_x, detector=detector,
+                                face_size=face_size, hog_upsample=hog_upsample).start()
+        measurements = ((t, vision.frame(seq), shapes) for seq, t, shapes in vision.results())
+    else:
+        detector = make_detector(detector, face_size=face_size, hog_upsample=hog_upsample)
+        predictor = dlib.shape_predictor('shape_predictor_68_face_landmarks.dat')
+        selector = DriverSelector(seat_x=seat_x)
+        face_tracker = (FaceTracker(detector, mode=track_mode, detect_every=detect_every, selector=selector)
+                        if track_mode else None)
+        flow = LandmarkFlow(predictor) if landmark_flow and face_tracker is not None else None
+        measurements = detect_landmarks(camera, detector, predictor, face_tracker, flow, selector, max_fps)
 
+    measure = FaceMeasure()
     red_flag = False
-    while True:
-        frame = picam2.capture_array()
-        tmp_pic = frame
-        frame = imutils.resize(frame, width=450)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        rects = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), flags=cv2.CASCADE_SCALE_IMAGE)
-
-        for (x, y, w, h) in rects:
-            rect = dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
-            shape = predictor(gray, rect)
-            shape = face_utils.shape_to_np(shape)
-            eye = final_ear(shape)
-            ear = eye[0]
-            leftEye = eye[1]
-            rightEye = eye[2]
-            distance = lip_distance(shape)
-            leftEyeHull = cv2.convexHull(leftEye)
-            rightEyeHull = cv2.convexHull(rightEye)
-            cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
-            cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
-            lip = shape[48:60]
-            cv2.drawContours(frame, [lip], -1, (0, 255, 0), 1)
-
-            if not red_flag:
-                red_flag = True
-                print("👁️ Starting red-eye detection thread")
-                red_eye_thread = Thread(target=capture_and_detect_red_eye, args=(alert_queue,))
-                red_eye_thread.daemon = True
-                red_eye_thread.start()
-
-            if ear < EYE_AR_THRESH:
-                COUNTER += 1
-                if COUNTER >= EYE_AR_CONSEC_FRAMES:
+    latest_landmarks = {}
+    frames = 0
+    fps_start = time.perf_counter()
+    try:
+        for frame_time, frame, shapes in measurements:
+            render = debug is not None and frame is not None and debug.wants_frame()
+            if render:
+                overlays = []
+            for shape in shapes:
+                ear, distance = measure.update(shape)
+
+                # `shape` is refilled in place every frame, so the red-eye thread
+                # gets its own copy, a few times a second (well within its max_age)
+                if frame_time - latest_landmarks.get('t', float('-inf')) >= 0.2:
+                    latest_landmarks['shape'], latest_landmarks['t'] = shape.copy(), frame_time
+                if not red_flag:
+                    red_flag = True
+                    print("👁️ Starting red-eye detection thread")
+                    red_eye_thread = Thread(target=capture_and_detect_red_eye, args=(alert_queue, camera, latest_landmarks))
+                    red_eye_thread.daemon = True
+                    red_eye_thread.start()
+
+                state = temporal.update(frame_time, ear, distance)
+                if state.drowsy:
                     if not alarm_status:
                         alarm_status = True
                         if alarm_path:
                             t = Thread(target=sound_alarm, args=(alarm_path, alert_queue))
                             t.daemon = True
                             t.start()
-                    cv2.putText(frame, "DROWSINESS ALERT!", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            else:
-                COUNTER = 0
-                alarm_status = False
-
-            if distance > YAWN_THRESH:
-                cv2.putText(frame, "Yawn Alert", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                if not alarm_status2 and not saying:
-                    alarm_status2 = True
-                    if alarm_path:
-                        t = Thread(target=sound_alarm, args=(alarm_path, alert_queue))
-                        t.daemon = True
-                        t.start()
-            else:
-                alarm_status2 = False
+                else:
+                    alarm_status = False
+
+                if state.yawning:
+                    if not alarm_status2 and not saying:
+                        alarm_status2 = True
+                        if alarm_path:
+                            t = Thread(target=sound_alarm, args=(alarm_path, alert_queue))
+                            t.daemon = True
+                            t.start()
+                else:
+                    alarm_status2 = False
 
-            cv2.putText(frame, "EAR: {:.2f}".format(ear), (300, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            cv2.putText(frame, "YAWN: {:.2f}".format(distance), (300, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                if render:
+                    overlays.append((shape.copy(), ear, distance, state))
 
-        time.sleep(0.1)
+            if render:
+                annotated = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                for overlay in overlays:
+                    draw_overlay(annotated, *overlay)
+                debug.publish(annotated)
+
+            frames += 1
+            if frames % 100 == 0:
+                elapsed = time.perf_counter() - fps_start
+                print(f"Vision loop: {100 / elapsed:.1f} FPS"
+                      + (f", tracker {face_tracker.stats()}" if face_tracker is not None else "")
+                      + (f", landmark flow {flow.stats()}" if flow is not None else "")
+                      + (f", driver selection {selector.stats()}" if selector is not None else "")
+                      + (f", pipeline {vision.stats()}" if vision is not None else "")
+                      + (f", debug stream {debug.stats()}" if debug is not None else ""))
+                fps_start = time.perf_counter()
+    finally:
+        if vision is not None:
+            print(f"Pipeline stages: {vision.stats()}")
+            vision.stop()
+        if debug is not None:
+            debug.close()
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video", nargs="+", help="replay these video files instead of the Pi camera")
+    ap.add_argument("--fps", type=float, default=30.0, help="pace replayed video to this frame rate (0: unpaced)")
+    ap.add_argument("--pipeline", action="store_true", help="run detection and landmarks in a separate process")
+    ap.add_argument("--debug-port", type=int, help="serve an annotated MJPEG stream on this port")
+    ap.add_argument("--debug-host", default="127.0.0.1",
+                    help="address the debug stream listens on (0.0.0.0: every interface, unauthenticated)")
+    ap.add_argument("--seat-x", type=float, default=0.5, help="driver's position across the frame (0 left, 1 right)")
+    ap.add_argument("--detector", choices=DETECTORS, default="haar", help="face detector backend")
+    ap.add_argument("--face-size", type=int, nargs=2, metavar=("MIN", "MAX"),
+                    help="expected face side range in pixels, for the haar-range detector")
+    ap.add_argument("--hog-upsample", type=int, default=1, help="image doublings for the hog detector")
+    ap.add_argument("--max-fps", type=float, help="cap the vision loop's frame rate (default: uncapped)")
+    args = ap.parse_args()
+
+    camera = FakeCamera(args.video, fps=args.fps) if args.video else PiCamera()
     try:
-        run_drowsiness_detection(queue.Queue())  # For standalone testing
+        run_drowsiness_detection(queue.Queue(), camera=camera, pipeline=args.pipeline, debug_port=args.debug_port,
+                                 debug_host=args.debug_host, seat_x=args.seat_x, detector=args.detector,
+                                 face_size=args.face_size, hog_upsample=args.hog_upsample, max_fps=args.max_fps)  # For standalone testing
     except KeyboardInterrupt:
         print("Drowsiness detection terminated")
-        picam2.stop()
         cv2.destroyAllWindows()
+    finally:
+        camera.close()
@@ -0,0 +1,260 @@
+# flat_forest.py
+import argparse
+import json
+import mmap as mmap_module
+import time
+import numpy as np
+
+MAGIC = b'IFOREST1'
+ALIGN = 64
+BATCH_ROWS = 256
+
+# Node arrays of all trees concatenated. Nodes are renumbered so that siblings
+# are adjacent: a row at an internal node moves to left[node] + (x > threshold).
+# Leaves have threshold +inf and point to themselves, so a fixed number of steps
+# (the deepest tree) lands every row on its leaf.
+ARRAYS = ('feature', 'threshold', 'left', 'leaf_value', 'roots')
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def export_forest(model, path):
+    """Flatten a fitted IsolationForest into one memory-mappable file."""
+    from sklearn.ensemble._iforest import _average_path_length
+
+    features, thresholds, lefts, leaf_values, roots = [], [], [], [], []
+    base = 0
+    max_depth = 0
+    for estimator, tree_features in zip(model.estimators_, model.estimators_features_):
+        tree = estimator.tree_
+        n = tree.node_count
+        tree_features = np.asarray(tree_features)
+        # Same per-node terms IsolationForest adds up in _parallel_compute_tree_depths
+        avg_path_length = _average_path_length(tree.n_node_samples)
+        feature = np.zeros(n, dtype=np.int32)
+        threshold = np.full(n, np.inf)
+        left = np.zeros(n, dtype=np.int32)
+        leaf_value = np.zeros(n)
+        # Breadth-first renumbering: new ids are handed out to both children together
+        order = [(0, 0, 1)]  # (old id, new id, depth)
+        next_id = 1
+        for old, new, depth in order:
+            if tree.children_left[old] == -1:
+                left[new] = base + new
+                leaf_value[new] = depth + avg_path_length[old] - 1.0
+                continue
+            # Tree features index the estimator's feature subset; map back to input columns
+            feature[new] = tree_features[tree.feature[old]]
+            threshold[new] = tree.threshold[old]
+            left[new] = base + next_id
+            order.append((tree.children_left[old], next_id, depth + 1))
+            order.append((tree.children_right[old], next_id + 1, depth + 1))
+            next_id += 2
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        leaf_values.append(leaf_value)
+        roots.append(base)
+        max_depth = max(max_depth, tree.max_depth)
+        base += n
+
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'leaf_value': np.concatenate(leaf_values),
+        'roots': np.array(roots, dtype=np.int32),
+    }
+    header = {
+        'n_features': int(model.n_features_in_),
+        'n_trees': len(model.estimators_),
+        'max_depth': int(max_depth),
+        'denominator': float(len(model.estimators_) * _average_path_length([model._max_samples])[0]),
+        'offset': float(model.offset_),
+        'arrays': {},
+    }
+    # Offsets are relative to the end of the header block, so lay out data first
+    offset = 0
+    for name in ARRAYS:
+        arr = arrays[name]
+        header['arrays'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+        offset += arr.nbytes + _pad(arr.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * _pad(len(MAGIC) + 8 + len(header_bytes))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name in ARRAYS:
+            arr = arrays[name]
+            f.write(arr.tobytes())
+            f.write(b'\0' * _pad(arr.nbytes))
+    return path
+
+
+class FlatForest:
+    """Array-backed IsolationForest evaluator.
+
+    Exposes score_samples/decision_function/predict and offset_ like the sklearn
+    model, and produces identical values: inputs are compared as float32 like
+    sklearn's trees do and per-tree path lengths are summed in tree order.
+    """
+
+    def __init__(self, header, arrays):
+        self.n_features_in_ = header['n_features']
+        self.n_trees = header['n_trees']
+        self.max_depth = header['max_depth']
+        self.denominator = header['denominator']
+        self.offset_ = header['offset']
+        for name in ARRAYS:
+            arr = arrays[name]
+            # Node ids are used as gather indices; this is a no-copy view where intp is int32
+            if arr.dtype.kind == 'i':
+                arr = arr.astype(np.intp, copy=False)
+            setattr(self, name, arr)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load an exported forest; with mmap=True the arrays are views of the mapped file."""
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an exported forest")
+            header_len = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_len))
+            f.seek(0)
+            if mmap:
+                buffer = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ)
+            else:
+                buffer = f.read()
+        data_start = len(MAGIC) + 8 + header_len
+        arrays = {}
+        for name in ARRAYS:
+            spec = header['arrays'][name]
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)),
+                                         offset=data_start + spec['offset']).reshape(shape)
+        return cls(header, arrays)
+
+    def path_lengths(self, X):
+        """Sum of per-tree path lengths for each row of X (n_rows x n_features)."""
+        # sklearn compares float32 inputs against float64 thresholds; round once up front
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected rows of {self.n_features_in_} features, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input contains NaN")
+        n_rows = X.shape[0]
+        depths = np.empty(n_rows)
+        flat_X = X.ravel()
+        batch = max(1, min(n_rows, BATCH_ROWS))
+        shape = (batch, self.n_trees)
+        node = np.empty(shape, dtype=np.intp)
+        child = np.empty(shape, dtype=np.intp)
+        index = np.empty(shape, dtype=np.intp)
+        values = np.empty(shape)
+        threshold = np.empty(shape)
+        go_right = np.empty(shape, dtype=bool)
+        row_base = (np.arange(batch, dtype=np.intp) * self.n_features_in_)[:, None]
+        for start in range(0, n_rows, batch):
+            m = min(batch, n_rows - start)
+            cur, nxt = node[:m], child[:m]
+            cur[:] = self.roots
+            idx, val, thr, right = index[:m], values[:m], threshold[:m], go_right[:m]
+            offset = row_base[:m] + start * self.n_features_in_
+            for _ in range(self.max_depth):
+                # Every input index is a valid node id, so 'clip' only skips the bounds check
+                np.take(self.feature, cur, out=idx, mode='clip')
+                idx += offset
+                np.take(flat_X, idx, out=val, mode='clip')
+                np.take(self.threshold, cur, out=thr, mode='clip')
+                np.greater(val, thr, out=right)
+                np.take(self.left, cur, out=nxt, mode='clip')
+                nxt += right
+                cur, nxt = nxt, cur
+            # cumsum accumulates sequentially, matching sklearn's tree-by-tree additions
+            depths[start:start + m] = np.cumsum(np.take(self.leaf_value, cur), axis=1)[:, -1]
+        return depths
+
+    def score_samples(self, X):
+        depths = self.path_lengths(X)
+        # Same expression as sklearn: a zero denominator (max_samples=1) scores -0.5
+        return -(2 ** (-np.divide(depths, self.denominator, out=np.ones_like(depths),
+                                  where=self.denominator != 0)))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def load_model(path):
+    """Load an IsolationForest either from a .forest export or a joblib pickle."""
+    if str(path).endswith('.forest'):
+        return FlatForest.load(path)
+    import joblib
+    return joblib.load(path)
+
+
+def _bench(args):
+    import joblib
+    import pandas as pd
+    from scorer import MODEL_COLUMNS
+
+    start = time.perf_counter()
+    model = joblib.load(args.model)
+    pickle_load_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    forest = FlatForest.load(args.forest)
+    flat_load_ms = (time.perf_counter() - start) * 1e3
+    scaler = joblib.load(args.scaler)
+
+    X = scaler.transform(pd.read_csv(args.csv)[MODEL_COLUMNS].fillna(0).values)
+    start = time.perf_counter()
+    expected = model.decision_function(X)
+    sklearn_s = time.perf_counter() - start
+    start = time.perf_counter()
+    got = forest.decision_function(X)
+    flat_s = time.perf_counter() - start
+    if not np.array_equal(expected, got):
+        raise SystemExit(f"Mismatch: max abs diff {np.max(np.abs(expected - got)):.3e}")
+
+    single = X[:1]
+    n_iter = 200
+    start = time.perf_counter()
+    for _ in range(n_iter):
+        model.decision_function(single)
+    sklearn_row_ms = (time.perf_counter() - start) / n_iter * 1e3
+    start = time.perf_counter()
+    for _ in range(n_iter):
+        forest.decision_function(single)
+    flat_row_ms = (time.perf_counter() - start) / n_iter * 1e3
+
+    print(f"{len(X)} rows from {args.csv}: decision values identical")
+    print(f"load: pickle {pickle_load_ms:.1f} ms, flat {flat_load_ms:.2f} ms")
+    print(f"batch: sklearn {len(X) / sklearn_s:,.0f} rows/s, flat {len(X) / flat_s:,.0f} rows/s")
+    print(f"single row: sklearn {sklearn_row_ms:.2f} ms, flat {flat_row_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export and benchmark array-backed IsolationForest models")
+    sub = ap.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help="flatten a joblib IsolationForest into a .forest file")
+    export.add_argument('model', nargs='?', default='backup2.pkl')
+    export.add_argument('output', nargs='?', default='backup2.forest')
+    bench = sub.add_parser('bench', help="compare against the sklearn model on a CSV")
+    bench.add_argument('csv', nargs='?', default='../dataset/final.csv')
+    bench.add_argument('--model', default='backup2.pkl')
+    bench.add_argument('--forest', default='backup2.forest')
+    bench.add_argument('--scaler', default='scaler.pkl')
+    args = ap.parse_args()
+
+    if args.command == 'export':
+        import joblib
+        export_forest(joblib.load(args.model), args.output)
+        print(f"Exported {args.model} to {args.output}")
+    else:
+        _bench(args)
@@ -0,0 +1,93 @@
+# inference_worker.py
+import threading
+import time
+from collections import deque
+
+
+class LatestWindowQueue:
+    """Bounded queue that drops the oldest window instead of blocking the producer."""
+
+    def __init__(self, maxsize=1):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.submitted = 0
+        self.dropped = 0
+
+    def put(self, window):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append((time.monotonic(), window))
+            self.submitted += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return (enqueue_time, window), or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+
+class InferenceWorker(threading.Thread):
+    """Scores windows from a LatestWindowQueue off the sampling thread.
+
+    score_fn(window) does the actual inference; windows that waited longer than
+    max_age seconds in the queue are still scored but counted as late.
+    """
+
+    def __init__(self, score_fn, window_queue, max_age=3.0, report_every=20):
+        super().__init__(daemon=True)
+        self.score_fn = score_fn
+        self.window_queue = window_queue
+        self.max_age = max_age
+        self.report_every = report_every
+        self.processed = 0
+        self.late = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def wait_idle(self, timeout=10.0):
+        """Wait until every queued window has been scored (used when a finite source ends)."""
+        deadline = time.monotonic() + timeout
+        while (self.processed + self.window_queue.dropped < self.window_queue.submitted
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            item = self.window_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            enqueued_at, window = item
+            if time.monotonic() - enqueued_at > self.max_age:
+                self.late += 1
+            try:
+                self.score_fn(window)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in inference worker: {e}")
+            latency = time.monotonic() - enqueued_at
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self.processed += 1
+            if self.report_every and self.processed % self.report_every == 0:
+                print(f"Inference stats: {self.stats()}")
+
+    def stats(self):
+        return {
+            'submitted': self.window_queue.submitted,
+            'processed': self.processed,
+            'dropped': self.window_queue.dropped,
+            'late': self.late,
+            'errors': self.errors,
+            'last_latency': round(self.last_latency, 4),
+            'max_latency': round(self.max_latency, 4),
+        }
@@ -8,10 +8,6 @@ from firebase_admin import credentials, messaging
 from working import run_sensor_loop
 from final2 import run_drowsiness_detection
 
-# Initialize Firebase by creating your certificate and replace here
-cred = credentials.Certificate("hcai-project-cdaf1-firebase-adminsdk-fbsvc-309022b7c8.json")
-firebase_admin.initialize_app(cred)
-
 # Shared alert queue
 alert_queue = queue.Queue()
 
@@ -72,6 +68,12 @@ def alert_handler():
 
 def main():
     print("Starting main application...")
+
+    # Initialize Firebase by creating your certificate and replace here.
+    # Done here rather than at import: the vision pipeline's worker process
+    # re-imports this module and must not initialise Firebase again.
+    cred = credentials.Certificate("hcai-project-cdaf1-firebase-adminsdk-fbsvc-309022b7c8.json")
+    firebase_admin.initialize_app(cred)
     
     # Start alert handler thread
     alert_thread = threading.Thread(target=alert_handler, daemon=True)
@@ -84,7 +86,8 @@ def main():
     print("Started sensor thread")
     
     # Start drowsiness detection thread
-    drowsiness_thread = threading.Thread(target=run_drowsiness_detection, args=(alert_queue,), daemon=True)
+    drowsiness_thread = threading.Thread(target=run_drowsiness_detection, args=(alert_queue,),
+                                         kwargs={'pipeline': True}, daemon=True)
     drowsiness_thread.start()
     print("Started drowsiness detection thread")
     
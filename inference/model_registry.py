@@ -0,0 +1,121 @@
+# model_registry.py
+import hashlib
+import os
+import threading
+import time
+import joblib
+from flat_forest import load_model
+
+
+def _stat(paths):
+    stats = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stats.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stats.append(None)
+    return tuple(stats)
+
+
+def _digest(paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelRegistry:
+    """Loads the model and scaler once and hot-swaps them when the files change.
+
+    build(model, scaler) turns the loaded artifacts into whatever the caller
+    scores with (e.g. a CompiledScorer); `current` always returns the active one
+    and is swapped with a single attribute assignment, so readers never see a
+    half-loaded version. A background thread polls mtime/size and only reloads
+    when the content hash actually changed. Files being pushed should be written
+    elsewhere and renamed into place; a failed load keeps the current version.
+    """
+
+    def __init__(self, model_path, scaler_path, build=None, poll_interval=5.0, history=3):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.paths = (model_path, scaler_path)
+        self.build = build or (lambda model, scaler: (model, scaler))
+        self.poll_interval = poll_interval
+        self.history = history
+        self.current = None
+        self.version = None
+        self._previous = []
+        self._seen_stat = None
+        self._seen_digest = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _load(self):
+        model = load_model(self.model_path)
+        scaler = joblib.load(self.scaler_path)
+        return self.build(model, scaler)
+
+    def _activate(self, obj, digest):
+        if self.current is not None:
+            self._previous.append((self.current, self.version))
+            del self._previous[:-self.history]
+        self.version = {'digest': digest, 'loaded_at': time.strftime("%Y-%m-%d %H:%M:%S")}
+        self.current = obj
+
+    def reload(self, force=False):
+        """Load the files from disk if their content changed (or always with force).
+
+        Returns True if a new version was activated.
+        """
+        with self._lock:
+            stat = _stat(self.paths)
+            if not force and stat == self._seen_stat:
+                return False
+            try:
+                digest = _digest(self.paths)
+                if not force and digest == self._seen_digest:
+                    self._seen_stat = stat
+                    return False
+                obj = self._load()
+            except Exception as e:
+                # Don't retry until the files change again
+                self._seen_stat = stat
+                print(f"Error loading model/scaler, keeping current version: {e}")
+                return False
+            self._seen_stat = stat
+            self._seen_digest = digest
+            self._activate(obj, digest)
+            print(f"Model and scaler loaded successfully (sha256 {digest[:12]}).")
+            return True
+
+    def reset(self):
+        """Reload the model and scaler from disk regardless of whether they changed."""
+        return self.reload(force=True)
+
+    def rollback(self):
+        """Reactivate the previous version; the files on disk stay marked as seen."""
+        with self._lock:
+            if not self._previous:
+                print("No previous model version to roll back to.")
+                return False
+            self.current, self.version = self._previous.pop()
+            print(f"Rolled back to model version {self.version['digest'][:12]}.")
+            return True
+
+    def start(self):
+        """Start watching the files in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.reload()
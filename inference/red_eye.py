@@ -0,0 +1,450 @@
+# red_eye.py
+import base64
+import collections
+import os
+import random
+import time
+import numpy as np
+import cv2
+import requests
+import simplejpeg
+
+PROMPT = "Detect any red-eye symptoms in this image. Respond with only 'yes' or 'no', strictly nothing else."
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+EYE_LANDMARKS = slice(36, 48)
+
+
+def eye_crop(frame, shape, scale=(1.0, 1.0), margin=0.4):
+    """Crop of `frame` around both eyes (landmarks 36-47), as a view.
+
+    `shape` is the (68, 2) landmark array in detection coordinates and `scale`
+    the (x, y) factor from those to `frame`; the eye bounding box is grown by
+    `margin` of its size on every side. Returns (crop, eyes) with the 12 eye
+    landmarks in crop coordinates, or (None, None) if nothing is left.
+    """
+    eyes = shape[EYE_LANDMARKS] * np.asarray(scale, dtype=float)
+    x0, y0 = eyes.min(axis=0)
+    x1, y1 = eyes.max(axis=0)
+    mx, my = (x1 - x0) * margin, max(y1 - y0, (x1 - x0) * 0.2) * margin * 2
+    height, width = frame.shape[:2]
+    x0, y0 = max(0, int(x0 - mx)), max(0, int(y0 - my))
+    x1, y1 = min(width, int(np.ceil(x1 + mx))), min(height, int(np.ceil(y1 + my)))
+    if x1 - x0 < 8 or y1 - y0 < 8:
+        return None, None
+    return frame[y0:y1, x0:x1], eyes - (x0, y0)
+
+
+class RedEyeScore:
+    """Result of RedEyePreClassifier.score()."""
+
+    __slots__ = ('red_ratio', 'mean_a', 'pixels', 'decision', 'confidence')
+
+    def __init__(self, red_ratio, mean_a, pixels, decision, confidence):
+        self.red_ratio = red_ratio
+        self.mean_a = mean_a
+        self.pixels = pixels
+        self.decision = decision
+        self.confidence = confidence
+
+    def __repr__(self):
+        return (f"RedEyeScore(decision={self.decision}, confidence={self.confidence:.2f}, "
+                f"red_ratio={self.red_ratio:.3f}, mean_a={self.mean_a:.1f}, pixels={self.pixels})")
+
+
+class RedEyePreClassifier:
+    """On-device sclera redness score that decides which crops need the remote check.
+
+    Inside the two eye polygons a pixel counts as red when its hue is red
+    (OpenCV H <= red_hue or >= 180 - red_hue), it is saturated and bright
+    enough, and its Lab a* (green-red, 128 neutral) is at least min_a. The
+    share of red pixels decides:
+
+    - 'negative' below low: handled locally, no remote call;
+    - 'positive' at or above high, 'ambiguous' in between: escalated.
+
+    Confidence is how far the ratio sits from the ambiguous band (0 inside
+    it, 1 at zero redness or at twice high). On the test clip normal eyes
+    score ~0.00; min_a/low/high are starting points to tune on real footage.
+    """
+
+    def __init__(self, low=0.03, high=0.15, red_hue=10, min_saturation=60, min_value=60, min_a=145,
+                 min_pixels=30):
+        self.low = low
+        self.high = high
+        self.red_hue = red_hue
+        self.min_saturation = min_saturation
+        self.min_value = min_value
+        self.min_a = min_a
+        self.min_pixels = min_pixels
+        self.counts = {'negative': 0, 'ambiguous': 0, 'positive': 0, 'too_small': 0}
+
+    def score(self, crop, eyes):
+        """Score a BGR eye crop given the 12 eye landmarks in crop coordinates."""
+        mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+        polygons = np.round(eyes).astype(np.int32)
+        cv2.fillPoly(mask, [polygons[:6], polygons[6:]], 1)
+        inside = mask.view(bool)
+        pixels = int(np.count_nonzero(inside))
+        if pixels < self.min_pixels:
+            # Eyes closed or too far away to judge: let the remote check decide
+            self.counts['too_small'] += 1
+            return RedEyeScore(0.0, 128.0, pixels, 'ambiguous', 0.0)
+        hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)[inside]
+        a = cv2.cvtColor(crop, cv2.COLOR_BGR2LAB)[..., 1][inside]
+        hue = hsv[:, 0]
+        red = (((hue <= self.red_hue) | (hue >= 180 - self.red_hue))
+               & (hsv[:, 1] >= self.min_saturation) & (hsv[:, 2] >= self.min_value) & (a >= self.min_a))
+        ratio = float(np.count_nonzero(red)) / pixels
+        if ratio < self.low:
+            decision, confidence = 'negative', 1.0 - ratio / self.low
+        elif ratio >= self.high:
+            decision, confidence = 'positive', min(1.0, (ratio - self.high) / self.high)
+        else:
+            decision, confidence = 'ambiguous', 0.0
+        self.counts[decision] += 1
+        return RedEyeScore(ratio, float(a.mean()), pixels, decision, confidence)
+
+
+def encode_jpeg(image, quality=85):
+    """JPEG bytes of a BGR image, encoded in memory."""
+    return simplejpeg.encode_jpeg(np.ascontiguousarray(image), quality=quality, colorspace='BGR')
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while.
+
+    After failure_threshold consecutive failures the breaker opens and allow()
+    refuses calls for reset_timeout seconds; then one trial call is let
+    through (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def allow(self):
+        if self.state == 'open':
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = 'half-open'
+        return True
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half-open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.trips += 1
+            self.state = 'open'
+            self.opened_at = self.clock()
+
+
+class CallBudget:
+    """At most max_calls calls in any period seconds (sliding window)."""
+
+    def __init__(self, max_calls=60, period=3600.0, clock=time.monotonic):
+        self.max_calls = max_calls
+        self.period = period
+        self.clock = clock
+        self._calls = collections.deque()
+
+    def allow(self):
+        now = self.clock()
+        while self._calls and now - self._calls[0] >= self.period:
+            self._calls.popleft()
+        return len(self._calls) < self.max_calls
+
+    def spend(self):
+        self._calls.append(self.clock())
+
+    def remaining(self):
+        self.allow()
+        return self.max_calls - len(self._calls)
+
+
+def dhash(image, size=8):
+    """64-bit (size*size) difference hash of an image, as an int.
+
+    The crop is normalised to grayscale at (size + 1) x size pixels, so
+    scale and small shifts or exposure changes barely move the hash; each
+    bit says whether a pixel is brighter than its right neighbour.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class VerdictCache:
+    """LRU + TTL cache of red-eye verdicts keyed by dhash().
+
+    get() returns the verdict of the nearest cached hash within `radius`
+    bits (Hamming distance), so a near-identical crop reuses it. Entries
+    expire ttl seconds after they were stored, whether used or not, so a
+    changing condition is re-checked; beyond `capacity` the least recently
+    used entry is evicted.
+    """
+
+    def __init__(self, capacity=64, ttl=60.0, radius=6, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.radius = radius
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expire(self):
+        now = self.clock()
+        for key in [k for k, (_, stored) in self._entries.items() if now - stored >= self.ttl]:
+            del self._entries[key]
+            self.expirations += 1
+
+    def get(self, key):
+        self._expire()
+        best, best_distance = None, self.radius + 1
+        for cached in self._entries:
+            distance = bin(cached ^ key).count("1")
+            if distance < best_distance:
+                best, best_distance = cached, distance
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best)
+        return self._entries[best][0]
+
+    def put(self, key, verdict):
+        self._entries[key] = (verdict, self.clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class RetryableError(Exception):
+    pass
+
+
+class RedEyeClient:
+    """Remote red-eye check over the Gemini REST API with one persistent session.
+
+    check(jpeg) returns True/False for the model's yes/no, or None when the call
+    was skipped (breaker open, budget spent) or failed. A call makes at most
+    1 + max_retries attempts, retrying only on connection errors, 429 and 5xx,
+    with short jittered backoff, so a failing API costs the caller at most
+    about (1 + max_retries) * timeout seconds. api_key and base_url default to
+    the API_KEY and RED_EYE_BASE_URL environment variables; base_url can point
+    at a local stub server for testing.
+    """
+
+    def __init__(self, api_key=None, base_url=None, model="gemini-2.0-flash", timeout=5.0,
+                 max_retries=2, backoff=0.5, breaker=None, budget=None, session=None):
+        base_url = os.getenv("RED_EYE_BASE_URL", GEMINI_BASE_URL) if base_url is None else base_url
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.budget = budget if budget is not None else CallBudget()
+        self.session = session if session is not None else requests.Session()
+        api_key = os.getenv("API_KEY", "") if api_key is None else api_key
+        self.session.headers.update({"x-goog-api-key": api_key, "Content-Type": "application/json"})
+        self.calls = 0
+        self.failures = 0
+        self.skipped_open = 0
+        self.skipped_budget = 0
+        self.bytes_sent = 0
+        self.last_latency = None
+
+    def _post(self, body):
+        response = self.session.post(f"{self.base_url}/models/{self.model}:generateContent",
+                                     json=body, timeout=self.timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+
+    def check(self, jpeg):
+        if not self.breaker.allow():
+            self.skipped_open += 1
+            return None
+        if not self.budget.allow():
+            self.skipped_budget += 1
+            return None
+        self.budget.spend()
+        self.calls += 1
+        body = {"contents": [{"parts": [
+            {"text": PROMPT},
+            {"inline_data": {"mime_type": "image/jpeg", "data": base64.b64encode(jpeg).decode("ascii")}},
+        ]}]}
+        self.bytes_sent += len(body["contents"][0]["parts"][1]["inline_data"]["data"])
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            try:
+                text = self._post(body)
+            except (requests.ConnectionError, requests.Timeout, RetryableError) as e:
+                print(f"API Error: {e}")
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+                print(f"API Error: {e}")
+                break
+            self.last_latency = time.monotonic() - started
+            self.breaker.record_success()
+            print("API Response:", text)
+            return text.strip().lower() == 'yes'
+        self.failures += 1
+        self.breaker.record_failure()
+        return None
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'skipped_open': self.skipped_open,
+            'skipped_budget': self.skipped_budget,
+            'bytes_sent': self.bytes_sent,
+            'breaker': self.breaker.state,
+            'budget_left': self.budget.remaining(),
+        }
+
+
+if __name__ == "__main__":
+    # Payload size of the eye crop vs the old full-frame file, then the client
+    # against a local stub server that answers, fails and recovers.
+    import argparse
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("image", nargs="?", help="photo with a face (default: synthetic frame)")
+    ap.add_argument("--cascade", default="haarcascade_frontalface_default.xml")
+    ap.add_argument("--predictor", default="shape_predictor_68_face_landmarks.dat")
+    args = ap.parse_args()
+
+    lores_size, main_size = (448, 252), (1280, 720)
+    shape = None
+    if args.image:
+        import dlib
+        from imutils import face_utils
+        frame = cv2.resize(cv2.imread(args.image), main_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(cv2.resize(frame, lores_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        faces = cv2.CascadeClassifier(args.cascade).detectMultiScale(gray, 1.1, 5, minSize=(30, 30))
+        if len(faces):
+            x, y, w, h = (int(v) for v in faces[0])
+            predictor = dlib.shape_predictor(args.predictor)
+            shape = face_utils.shape_to_np(predictor(gray, dlib.rectangle(x, y, x + w, y + h)))
+    else:
+        rng = np.random.default_rng(0)
+        frame = cv2.GaussianBlur(rng.integers(0, 256, (main_size[1], main_size[0], 3), dtype=np.uint8), (9, 9), 0)
+    if shape is None:
+        # Eyes where a centred driver's would be in the lores frame
+        shape = np.zeros((68, 2), dtype=int)
+        shape[36:42] = [(180, 100), (188, 95), (196, 95), (204, 100), (196, 104), (188, 104)]
+        shape[42:48] = [(244, 100), (252, 95), (260, 95), (268, 100), (260, 104), (252, 104)]
+
+    scale = (main_size[0] / lores_size[0], main_size[1] / lores_size[1])
+    crop, eyes = eye_crop(frame, shape, scale)
+    jpeg = encode_jpeg(crop)
+    ok, old_file = cv2.imencode(".jpg", frame)
+    old_payload = len(base64.b64encode(old_file.tobytes()))
+    new_payload = len(base64.b64encode(jpeg))
+    print(f"full frame file: {old_payload} bytes base64; eye crop {crop.shape[1]}x{crop.shape[0]}: "
+          f"{new_payload} bytes base64 ({old_payload / new_payload:.0f}x smaller)")
+
+    # Pre-classifier on the crop as is, and with the eye regions tinted red
+    classifier = RedEyePreClassifier()
+    clean = classifier.score(crop, eyes)
+    tinted = crop.copy()
+    mask = np.zeros(crop.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(eyes[:6]).astype(np.int32), np.round(eyes[6:]).astype(np.int32)], 1)
+    inside = mask.view(bool)
+    tinted[inside] = (0.4 * tinted[inside] + 0.6 * np.array([40, 40, 210])).astype(np.uint8)
+    red = classifier.score(tinted, eyes)
+    started = time.perf_counter()
+    for _ in range(100):
+        classifier.score(crop, eyes)
+    print(f"pre-classifier ({(time.perf_counter() - started) * 10:.2f} ms/crop): {clean}; tinted: {red}")
+    assert red.decision == 'positive'
+    if args.image:
+        assert clean.decision == 'negative'
+
+    # Verdict cache: the same eyes a pixel or two off or under other exposure
+    # reuse the verdict, different eyes don't; entries expire after ttl
+    now = [0.0]
+    clock = lambda: now[0]
+    cache = VerdictCache(capacity=2, ttl=60.0, radius=6, clock=clock)
+    cache.put(dhash(crop), False)
+    h, w = crop.shape[:2]
+    similar = [crop[1:, 2:], crop[:h - 2, :w - 1], cv2.convertScaleAbs(crop, alpha=1.1, beta=10)]
+    distances = [bin(dhash(c) ^ dhash(crop)).count("1") for c in similar]
+    assert all(cache.get(dhash(c)) is False for c in similar), distances
+    other = crop[:, ::-1]
+    assert cache.get(dhash(other)) is None
+    cache.put(dhash(other), True)
+    cache.put(dhash(tinted[::-1]), True)
+    now[0] = 61.0
+    assert cache.get(dhash(crop)) is None
+    print(f"dhash distances of shifted/brighter crops: {distances}; cache {cache.stats()}")
+
+    replies = collections.deque()
+
+    class StubGemini(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            status, text = replies.popleft() if replies else (200, "no")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            if status == 200:
+                self.wfile.write(json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode())
+
+        def log_message(self, *a):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGemini)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    now[0] = 0.0
+    client = RedEyeClient(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}", backoff=0.01,
+                          breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30.0, clock=clock),
+                          budget=CallBudget(max_calls=5, period=60.0, clock=clock))
+    replies.extend([(200, "Yes\n"), (200, "no")])
+    assert client.check(jpeg) is True and client.check(jpeg) is False
+    replies.extend([(500, "")] * 6)
+    started = time.monotonic()
+    assert client.check(jpeg) is None and client.check(jpeg) is None
+    assert client.breaker.state == 'open'
+    assert client.check(jpeg) is None and client.skipped_open == 1
+    print(f"two failing calls took {time.monotonic() - started:.2f} s, breaker {client.breaker.state}")
+    now[0] += 31.0
+    replies.clear()
+    replies.append((200, "no"))
+    assert client.check(jpeg) is False and client.breaker.state == 'closed'
+    assert client.check(jpeg) is None and client.skipped_budget == 1
+    print(f"recovered after reset timeout; budget enforced: {client.stats()}")
+    server.shutdown()
@@ -0,0 +1,140 @@
+# scheduler.py
+import bisect
+import time
+
+POLICIES = ('skip', 'merge', 'catch-up')
+
+
+class Histogram:
+    """Counts of values falling into buckets bounded by `edges` (upper bounds, inclusive)."""
+
+    def __init__(self, edges, unit=''):
+        self.edges = list(edges)
+        self.unit = unit
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.total += 1
+        self.max = max(self.max, float(value))
+
+    def as_dict(self):
+        labels = [f'<={e:g}{self.unit}' for e in self.edges] + [f'>{self.edges[-1]:g}{self.unit}']
+        return {label: n for label, n in zip(labels, self.counts) if n}
+
+
+class DeadlineScheduler:
+    """Fixed-rate deadlines at start + k * period on the monotonic clock.
+
+    Deadlines are computed from the start time rather than accumulated, so they
+    don't drift, and a wall-clock (NTP) step can't move them. poll(now) says how
+    many periods to act on at `now`; wait() sleeps until the next deadline.
+
+    A deadline that passes by more than `tolerance` is an overrun and is handled
+    by `policy`: 'catch-up' fires once for it and once per further missed period
+    (the old behaviour), 'merge' fires once for all of them and 'skip' drops
+    them and waits for the next deadline on the grid. Lateness of every deadline
+    goes into the jitter histogram (ms) and missed periods into the overrun one.
+    """
+
+    def __init__(self, period, policy='skip', tolerance=None, clock=time.monotonic, sleep=time.sleep):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.period = period
+        self.policy = policy
+        self.tolerance = period / 2 if tolerance is None else tolerance
+        self.clock = clock
+        self.sleep = sleep
+        self.start = None
+        self.next_deadline = None
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.jitter = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000], 'ms')
+        self.overrun_periods = Histogram([1, 2, 5, 10, 100])
+
+    def reset(self, start=None):
+        """Anchor the grid so the first deadline is one period after `start`."""
+        self.start = self.clock() if start is None else start
+        self.ticks = 0
+        self.next_deadline = self.start + self.period
+
+    def _advance(self, now):
+        # Returns (late, missed): how far past the deadline `now` is and how many
+        # further deadlines have also passed, and moves to the next future one
+        late = now - self.next_deadline
+        missed = int(late // self.period)
+        self.ticks += missed + 1
+        self.next_deadline = self.start + (self.ticks + 1) * self.period
+        self.jitter.add(late * 1000.0)
+        return late, missed
+
+    def poll(self, now=None):
+        """Number of periods to act on at `now` (0 until the next deadline)."""
+        now = self.clock() if now is None else now
+        if self.start is None:
+            self.reset(now)
+            return 0
+        if now < self.next_deadline:
+            return 0
+        late, missed = self._advance(now)
+        if late <= self.tolerance:
+            return 1
+        self.overruns += 1
+        self.missed += missed + 1
+        self.overrun_periods.add(missed + 1)
+        if self.policy == 'catch-up':
+            return missed + 1
+        if self.policy == 'merge':
+            return 1
+        return 0
+
+    def wait(self):
+        """Sleep until the next deadline; returns the number of deadlines that
+        passed without a wait (0 when on schedule)."""
+        if self.start is None:
+            self.reset()
+            return 0
+        delay = self.next_deadline - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+        late, missed = self._advance(self.clock())
+        if late > self.tolerance:
+            self.overruns += 1
+            self.missed += missed + 1
+            self.overrun_periods.add(missed + 1)
+        return missed
+
+    def stats(self):
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'missed': self.missed,
+            'jitter': self.jitter.as_dict(),
+            'max_jitter_ms': round(self.jitter.max, 2),
+            'overrun_periods': self.overrun_periods.as_dict(),
+        }
+
+
+if __name__ == "__main__":
+    # Windows every 3 s on a simulated clock with a 10 s stall after 9 s
+    for policy in POLICIES:
+        scheduler = DeadlineScheduler(3.0, policy)
+        emitted = []
+        for i in range(601):
+            t = i * 0.05 if i <= 180 else i * 0.05 + 10.0
+            for _ in range(scheduler.poll(t)):
+                emitted.append(round(t, 2))
+        print(f"{policy:>8}: windows at {emitted}, {scheduler.stats()['overruns']} overrun(s)")
+
+    # Real sleeping at 20 Hz: deadlines stay on the grid
+    scheduler = DeadlineScheduler(0.05)
+    scheduler.wait()
+    start = time.monotonic()
+    for _ in range(40):
+        scheduler.wait()
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    print(f"40 ticks of 50 ms in {elapsed:.3f} s; {scheduler.stats()}")
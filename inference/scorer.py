@@ -0,0 +1,105 @@
+# scorer.py
+import numpy as np
+
+# Columns the scaler and IsolationForest were fitted on, in training order
+# (final.csv minus the dropped toluen/nh4/acetone, gas variance and bookkeeping columns)
+MODEL_COLUMNS = [
+    'Ax_mean', 'Ay_mean', 'Az_mean', 'Gx_mean', 'Gy_mean', 'Gz_mean',
+    'Ax_var', 'Ay_var', 'Az_var', 'Gx_var', 'Gy_var', 'Gz_var',
+    'co_mean', 'co2_mean', 'alcohol_mean', 'mean_bpm'
+]
+
+
+class CompiledScorer:
+    """Single-row IsolationForest scorer bound once to a feature vector layout.
+
+    source_columns names the entries of the vectors passed to score_vector; the
+    model columns are gathered from it with a precomputed index, scaled in a
+    preallocated buffer and scored with one forest evaluation. The label comes
+    from the sign of the decision function, which is what model.predict does.
+    Not thread-safe: use one scorer per thread.
+    """
+
+    def __init__(self, model, scaler, source_columns=MODEL_COLUMNS):
+        if scaler.n_features_in_ != len(MODEL_COLUMNS):
+            raise ValueError(f"Scaler expects {scaler.n_features_in_} features, "
+                             f"scorer is bound to {len(MODEL_COLUMNS)}")
+        source_columns = list(source_columns)
+        self.model = model
+        self.scaler = scaler
+        self.source_columns = source_columns
+        self._index = np.array([source_columns.index(c) for c in MODEL_COLUMNS])
+        n = len(MODEL_COLUMNS)
+        # Same subtract-then-divide as StandardScaler.transform so results match bit for bit
+        self._mean = scaler.mean_ if scaler.with_mean else np.zeros(n)
+        self._scale = scaler.scale_ if scaler.with_std else np.ones(n)
+        self._x = np.zeros((1, n))
+
+    def decision_function(self, X_scaled):
+        """Decision values for already scaled rows; one pass over the forest."""
+        return self.model.score_samples(X_scaled) - self.model.offset_
+
+    def score_vector(self, vector):
+        """Return (label, score) for a vector laid out as source_columns."""
+        x = self._x
+        np.take(vector, self._index, out=x[0])
+        if np.isnan(x).any():
+            print("Warning: Missing values detected. Filling with 0.")
+            np.nan_to_num(x, copy=False, nan=0.0)
+        x -= self._mean
+        x /= self._scale
+        score = self.decision_function(x)[0]
+        label = 'Anomaly' if score < 0 else 'Normal'
+        return label, score
+
+    def score_row(self, row):
+        """Return (label, score) for a dict row such as the ones saved to test_data.csv."""
+        return self.score_vector(np.array([row.get(c, np.nan) for c in self.source_columns], dtype=float))
+
+
+if __name__ == "__main__":
+    # Compare against the pandas path previously used in working.py
+    import time
+    import joblib
+    import pandas as pd
+
+    def legacy_score(data_point, model, scaler):
+        df = pd.DataFrame([data_point])
+        columns_to_drop = ['timestamp', 'sample_count', 'toluen_var', 'nh4_var', 'acetone_var',
+                           'toluen_mean', 'nh4_mean', 'acetone_mean', 'co_var', 'co2_var', 'alcohol_var']
+        features = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
+        if features.isnull().any().any():
+            features = features.fillna(0)
+        X_scaled = scaler.transform(features.values)
+        prediction = model.predict(X_scaled)
+        score = model.decision_function(X_scaled)
+        label = 'Anomaly' if prediction[0] == -1 else 'Normal'
+        return label, score[0]
+
+    model = joblib.load('backup2.pkl')
+    scaler = joblib.load('scaler.pkl')
+    rows = pd.read_csv('../dataset/final.csv').drop(columns=['anomaly'], errors='ignore')
+    rows = rows.sample(n=200, random_state=0).to_dict('records')
+
+    source_columns = [c for c in rows[0] if c != 'timestamp']
+    scorer = CompiledScorer(model, scaler, source_columns)
+    vectors = [np.array([row[c] for c in source_columns], dtype=float) for row in rows]
+
+    anomalies = 0
+    for row, vector in zip(rows, vectors):
+        expected = legacy_score(row, model, scaler)
+        got = scorer.score_vector(vector)
+        assert got == expected, (got, expected)
+        anomalies += got[0] == 'Anomaly'
+    print(f"{len(rows)} rows match the pandas path exactly ({anomalies} anomalies)")
+
+    start = time.perf_counter()
+    for row in rows:
+        legacy_score(row, model, scaler)
+    legacy_ms = (time.perf_counter() - start) / len(rows) * 1e3
+    start = time.perf_counter()
+    for vector in vectors:
+        scorer.score_vector(vector)
+    compiled_ms = (time.perf_counter() - start) / len(rows) * 1e3
+    print(f"pandas path: {legacy_ms:.2f} ms/row, compiled scorer: {compiled_ms:.2f} ms/row "
+          f"({legacy_ms / compiled_ms:.1f}x)")
@@ -0,0 +1,279 @@
+# sensor_source.py
+import csv
+import time
+from collections import deque
+import numpy as np
+from sensor_window import CHANNELS
+from serial_reader import SerialReader, StreamStats
+from scheduler import DeadlineScheduler
+
+GAS_CHANNELS = CHANNELS[6:]
+SAMPLE_RATE = 20.0
+WINDOW_SECONDS = 3.0
+
+
+class SensorSource:
+    """A stream of sensor samples.
+
+    read() returns (t, values) where t is in epoch seconds and values holds the
+    twelve CHANNELS in order, or None once a finite source is exhausted. Sources
+    that replay recorded or generated data pace themselves: speed=1.0 is real
+    time, N is N times faster and 0/None runs as fast as possible.
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._t0 = None
+        self._wall0 = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        """Per-stream counters, for sources that have any."""
+        return {}
+
+    def _pace(self, t):
+        if not self.speed:
+            return
+        if self._t0 is None:
+            self._t0 = t
+            self._wall0 = time.monotonic()
+            return
+        delay = self._wall0 + (t - self._t0) / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class HardwareSource(SensorSource):
+    """MPU6050 on I2C plus the Arduino gas sensors on serial.
+
+    The serial port is read by a SerialReader thread, so sampling the IMU never
+    waits on readline(). Each IMU sample is paired with the gas values at its
+    monotonic timestamp: align='latest' holds the newest gas line, align='interp'
+    interpolates between the gas lines around it, which delays output until the
+    next gas line arrives (or max_gas_age passes, after which the latest is held).
+    Gas values older than max_gas_age are counted as stale.
+
+    With imu_rate set the MPU6050 samples into its FIFO at that rate and each
+    read drains it in bursts every `interval` seconds, with sample times derived
+    from the configured rate instead of the polling loop.
+    """
+
+    def __init__(self, port='/dev/ttyACM0', baudrate=115200, i2c_bus=1, interval=0.05,
+                 align='latest', max_gas_age=2.0, imu_rate=None):
+        super().__init__(speed=None)
+        import serial
+        import smbus
+        from mpu6050 import MPU6050
+
+        if align not in ('latest', 'interp'):
+            raise ValueError(f"Unknown alignment mode: {align}")
+        self.interval = interval
+        self.align = align
+        self.max_gas_age = max_gas_age
+        self.ser = serial.Serial(port, baudrate, timeout=1)
+        self.bus = smbus.SMBus(i2c_bus)
+        self.mpu = MPU6050(self.bus)
+        if imu_rate:
+            self.imu_rate = self.mpu.init_fifo(imu_rate)
+        else:
+            self.imu_rate = None
+            self.mpu.init()
+        self.gas_reader = SerialReader(self.ser, width=len(GAS_CHANNELS))
+        self.gas_reader.start()
+        self.imu_stats = StreamStats('imu')
+        self.stale_gas = 0
+        self._pending = deque()
+        # Sample (or FIFO drain) deadlines on a fixed monotonic grid; a stall
+        # skips the missed slots instead of sampling back-to-back
+        self.sample_clock = DeadlineScheduler(interval, policy='skip')
+        # Convert monotonic sample times to epoch seconds for the rows
+        self._epoch_offset = time.time() - time.monotonic()
+
+    def read_imu(self):
+        try:
+            return self.mpu.read()
+        except Exception as e:
+            self.imu_stats.drop()
+            print(f"Error reading MPU6050 data: {e}")
+            return 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+
+    def _sample_imu(self):
+        self.sample_clock.wait()
+        if self.imu_rate:
+            try:
+                times, values = self.mpu.read_fifo()
+            except Exception as e:
+                self.imu_stats.drop()
+                print(f"Error reading MPU6050 FIFO: {e}")
+                return
+            for t, imu in zip(times.tolist(), values.tolist()):
+                self.imu_stats.sample(t)
+                self._pending.append((t, tuple(imu)))
+            return
+        t = time.monotonic()
+        imu = self.read_imu()
+        self.imu_stats.sample(t)
+        self._pending.append((t, imu))
+
+    def read(self):
+        ring = self.gas_reader.ring
+        while True:
+            if not self._pending:
+                self._sample_imu()
+                continue
+            latest = ring.latest()
+            if latest is None:
+                # Nothing from the Arduino yet
+                self._pending.clear()
+                continue
+            t, imu = self._pending[0]
+            gas_t = latest[0]
+            if self.align == 'interp' and gas_t < t and time.monotonic() - gas_t < self.max_gas_age:
+                # Wait for the gas line after t
+                self._sample_imu()
+                continue
+            self._pending.popleft()
+            if t - gas_t > self.max_gas_age:
+                self.stale_gas += 1
+            gas = ring.at(t, interpolate=self.align == 'interp')
+            return t + self._epoch_offset, imu + tuple(gas)
+
+    def stats(self):
+        gas = self.gas_reader.stats.as_dict()
+        gas.update(timeouts=self.gas_reader.timeouts, stale=self.stale_gas)
+        imu = self.imu_stats.as_dict()
+        if self.imu_rate:
+            imu.update(fifo_overflows=self.mpu.overflows, clock_resyncs=self.mpu.resyncs)
+        return {'imu': imu, 'gas': gas, 'sample_schedule': self.sample_clock.stats()}
+
+    def close(self):
+        self.gas_reader.stop()
+        self.ser.close()
+        self.gas_reader.join(timeout=2.0)
+        self.bus.close()
+
+
+class ReplaySource(SensorSource):
+    """Replays a recorded CSV.
+
+    Raw captures (a 't' column plus the twelve channels, as written by
+    CaptureRecorder) are replayed sample by sample. Window-level files such as
+    dataset/final.csv or synthetic_sensor_data.csv are expanded back into
+    sample_count samples per 3 s row whose mean and sample variance equal the
+    row's *_mean and *_var values.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, seed=0):
+        super().__init__(speed)
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        self.path = path
+        self.loop = loop
+        if 't' in df.columns:
+            self._t = df['t'].to_numpy(dtype=float)
+            self._values = df[CHANNELS].to_numpy(dtype=float)
+        else:
+            self._t, self._values = self._expand_windows(df, np.random.default_rng(seed))
+        self._pos = 0
+        self._time_offset = 0.0
+
+    @staticmethod
+    def _expand_windows(df, rng):
+        t = _to_epoch(df['timestamp'])
+        counts = df['sample_count'].fillna(SAMPLE_RATE * WINDOW_SECONDS).astype(int).clip(lower=2).to_numpy()
+        means = df[[f'{c}_mean' for c in CHANNELS]].fillna(0).to_numpy(dtype=float)
+        stds = np.sqrt(df[[f'{c}_var' for c in CHANNELS]].fillna(0).clip(lower=0).to_numpy(dtype=float))
+        times, values = [], []
+        for row_t, count, mean, std in zip(t, counts, means, stds):
+            z = rng.standard_normal((count, len(CHANNELS)))
+            z -= z.mean(axis=0)
+            z /= z.std(axis=0, ddof=1)
+            values.append(mean + std * z)
+            # Samples cover the window that ends at the row's timestamp
+            times.append(row_t - WINDOW_SECONDS + (np.arange(count) + 1) * (WINDOW_SECONDS / count))
+        return np.concatenate(times), np.concatenate(values)
+
+    def __len__(self):
+        return len(self._t)
+
+    def read(self):
+        if self._pos == len(self._t):
+            if not self.loop or len(self._t) == 0:
+                return None
+            self._time_offset += self._t[-1] - self._t[0] + 1.0 / SAMPLE_RATE
+            self._pos = 0
+        t = self._t[self._pos] + self._time_offset
+        values = tuple(self._values[self._pos])
+        self._pos += 1
+        self._pace(t)
+        return t, values
+
+
+class SyntheticSource(SensorSource):
+    """Generates plausible parked-car readings with occasional bursts of motion and gas."""
+
+    BASELINE = np.array([1.08, 0.04, -0.01, -0.18, -0.16, -0.27, 4.0, 402.9, 1.3, 0.55, 4.3, 0.47])
+    NOISE = np.array([0.01, 0.01, 0.01, 0.1, 0.1, 0.1, 0.05, 0.08, 0.04, 0.02, 0.1, 0.02])
+
+    def __init__(self, rate=SAMPLE_RATE, n_samples=None, speed=1.0, burst_probability=0.001, seed=0):
+        super().__init__(speed)
+        self.rate = rate
+        self.n_samples = n_samples
+        self.burst_probability = burst_probability
+        self.rng = np.random.default_rng(seed)
+        self._count = 0
+        self._burst_left = 0
+        self._start = time.time()
+
+    def read(self):
+        if self.n_samples is not None and self._count >= self.n_samples:
+            return None
+        t = self._start + self._count / self.rate
+        self._count += 1
+        if self._burst_left == 0 and self.rng.random() < self.burst_probability:
+            self._burst_left = int(self.rate * WINDOW_SECONDS)
+        scale = self.NOISE * (20.0 if self._burst_left else 1.0)
+        if self._burst_left:
+            self._burst_left -= 1
+        values = tuple(self.BASELINE + scale * self.rng.standard_normal(len(CHANNELS)))
+        self._pace(t)
+        return t, values
+
+
+class CaptureRecorder(SensorSource):
+    """Passes samples through from another source while saving them as a raw capture."""
+
+    def __init__(self, source, path):
+        super().__init__(speed=None)
+        self.source = source
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(['t'] + CHANNELS)
+
+    def read(self):
+        sample = self.source.read()
+        if sample is not None:
+            t, values = sample
+            self._writer.writerow([repr(float(t))] + [repr(float(v)) for v in values])
+        return sample
+
+    def stats(self):
+        return self.source.stats()
+
+    def close(self):
+        self._file.close()
+        self.source.close()
+
+
+def _to_epoch(column):
+    """Local-time timestamp strings to epoch seconds, like time.mktime would give."""
+    import pandas as pd
+
+    parsed = pd.to_datetime(column)
+    return np.array([time.mktime(ts.timetuple()) for ts in parsed])
@@ -0,0 +1,294 @@
+# sensor_window.py
+import numpy as np
+
+CHANNELS = ['Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz',
+            'co', 'co2', 'alcohol', 'toluen', 'nh4', 'acetone']
+
+FEATURE_COLUMNS = [f'{c}_mean' for c in CHANNELS] + [f'{c}_var' for c in CHANNELS]
+
+
+def scale_columns(scales, channels=CHANNELS):
+    """Column names for the extra per-scale features, e.g. Ax_mean_10s ... acetone_var_10s."""
+    columns = []
+    for scale in scales:
+        columns += [f'{c}_mean_{scale:g}s' for c in channels] + [f'{c}_var_{scale:g}s' for c in channels]
+    return columns
+
+
+class RollingWindow:
+    """Sliding window over all sensor channels with O(1) mean/variance updates.
+
+    Samples live in a preallocated (window_size x channels) ring buffer. Running
+    sums and sums of squares are kept relative to a per-channel shift so that
+    large offsets (co2 sits around 400) don't cancel out the variance, and they
+    are recomputed exactly from the buffer once per window to stop drift.
+    """
+
+    def __init__(self, window_size=60, channels=CHANNELS):
+        self.channels = list(channels)
+        self.window_size = window_size
+        n = len(self.channels)
+        self._buf = np.zeros((window_size, n))
+        self._shift = np.zeros(n)
+        self._sum = np.zeros(n)
+        self._sumsq = np.zeros(n)
+        self._delta = np.zeros(n)
+        self._old = np.zeros(n)
+        self._pos = 0
+        self._since_rebase = 0
+        self.count = 0
+
+    def reset(self):
+        """Forget all samples without reallocating the buffer."""
+        self._pos = 0
+        self._since_rebase = 0
+        self.count = 0
+        self._sum.fill(0.0)
+        self._sumsq.fill(0.0)
+
+    def append(self, sample):
+        """Add one sample (values in channel order), evicting the oldest if full."""
+        if self.count == 0:
+            self._shift[:] = sample
+        d = self._delta
+        np.subtract(sample, self._shift, out=d)
+        if self.count == self.window_size:
+            old = self._old
+            np.subtract(self._buf[self._pos], self._shift, out=old)
+            self._sum -= old
+            old *= old
+            self._sumsq -= old
+        else:
+            self.count += 1
+        self._buf[self._pos] = sample
+        self._sum += d
+        d *= d
+        self._sumsq += d
+        self._pos += 1
+        if self._pos == self.window_size:
+            self._pos = 0
+        self._since_rebase += 1
+        if self._since_rebase >= self.window_size:
+            self._rebase()
+
+    def _rebase(self):
+        valid = self._buf if self.count == self.window_size else self._buf[:self.count]
+        self._shift[:] = valid.mean(axis=0)
+        centered = valid - self._shift
+        self._sum[:] = centered.sum(axis=0)
+        self._sumsq[:] = (centered * centered).sum(axis=0)
+        self._since_rebase = 0
+
+    def features(self, out=None):
+        """Return [means..., sample variances (ddof=1)...] for every channel."""
+        n = len(self.channels)
+        if out is None:
+            out = np.zeros(2 * n)
+        if self.count == 0:
+            out.fill(0.0)
+            return out
+        means = out[:n]
+        np.divide(self._sum, self.count, out=means)
+        if self.count > 1:
+            var = out[n:]
+            np.multiply(self._sum, means, out=var)
+            np.subtract(self._sumsq, var, out=var)
+            var /= self.count - 1
+            np.maximum(var, 0.0, out=var)
+        else:
+            out[n:] = 0.0
+        means += self._shift
+        return out
+
+
+class MultiScaleWindow:
+    """Means and variances over several time scales from one stream of samples.
+
+    Samples are summed into blocks of block_seconds (block_size samples at
+    `rate`). Completed blocks go into a ring of prefix sums, so the statistics
+    over the last n blocks are the difference of two ring entries: appending a
+    sample costs the same whatever the number of scales, and each scale is O(1)
+    to read. A scale of S seconds covers the last S / block_seconds complete
+    blocks (fewer while warming up). Sums are relative to a per-channel shift
+    that is re-centred, with the prefix sums rebuilt, every time the ring wraps.
+    """
+
+    def __init__(self, scales=(1, 10, 60), rate=20.0, block_seconds=1.0, channels=CHANNELS):
+        self.channels = list(channels)
+        self.scales = list(scales)
+        self.block_size = max(1, round(rate * block_seconds))
+        self._scale_blocks = [max(1, round(scale / block_seconds)) for scale in self.scales]
+        self._capacity = max(self._scale_blocks) + 1
+        n = len(self.channels)
+        self._cum_count = np.zeros(self._capacity)
+        self._cum_sum = np.zeros((self._capacity, n))
+        self._cum_sumsq = np.zeros((self._capacity, n))
+        self._shift = np.zeros(n)
+        self._block_sum = np.zeros(n)
+        self._block_sumsq = np.zeros(n)
+        self._delta = np.zeros(n)
+        self._block_count = 0
+        self.blocks = 0
+        self.count = 0
+
+    @property
+    def columns(self):
+        return scale_columns(self.scales, self.channels)
+
+    def reset(self):
+        self._cum_count.fill(0.0)
+        self._cum_sum.fill(0.0)
+        self._cum_sumsq.fill(0.0)
+        self._block_sum.fill(0.0)
+        self._block_sumsq.fill(0.0)
+        self._block_count = 0
+        self.blocks = 0
+        self.count = 0
+
+    def append(self, sample):
+        if self.count == 0:
+            self._shift[:] = sample
+        d = self._delta
+        np.subtract(sample, self._shift, out=d)
+        self._block_sum += d
+        d *= d
+        self._block_sumsq += d
+        self._block_count += 1
+        self.count += 1
+        if self._block_count == self.block_size:
+            self._close_block()
+
+    def _close_block(self):
+        prev = self.blocks % self._capacity
+        self.blocks += 1
+        cur = self.blocks % self._capacity
+        self._cum_count[cur] = self._cum_count[prev] + self._block_count
+        np.add(self._cum_sum[prev], self._block_sum, out=self._cum_sum[cur])
+        np.add(self._cum_sumsq[prev], self._block_sumsq, out=self._cum_sumsq[cur])
+        self._block_sum.fill(0.0)
+        self._block_sumsq.fill(0.0)
+        self._block_count = 0
+        if self.blocks % self._capacity == 0:
+            self._rebase()
+
+    def _rebase(self):
+        # Recover per-block sums, re-centre them on the newest block's mean and
+        # rebuild the prefix sums from zero
+        order = (np.arange(self._capacity) + self.blocks + 1) % self._capacity
+        count = np.diff(self._cum_count[order])
+        block_sum = np.diff(self._cum_sum[order], axis=0)
+        block_sumsq = np.diff(self._cum_sumsq[order], axis=0)
+        delta = block_sum[-1] / count[-1]
+        block_sumsq += count[:, None] * delta * delta - 2.0 * delta * block_sum
+        block_sum -= count[:, None] * delta
+        self._shift += delta
+        self._cum_count[order[0]] = 0.0
+        self._cum_sum[order[0]] = 0.0
+        self._cum_sumsq[order[0]] = 0.0
+        self._cum_count[order[1:]] = np.cumsum(count)
+        self._cum_sum[order[1:]] = np.cumsum(block_sum, axis=0)
+        self._cum_sumsq[order[1:]] = np.cumsum(block_sumsq, axis=0)
+
+    def features(self, out=None):
+        """Return [means..., variances (ddof=1)...] for each scale in turn."""
+        n = len(self.channels)
+        if out is None:
+            out = np.zeros(2 * n * len(self.scales))
+        cur = self.blocks % self._capacity
+        for i, n_blocks in enumerate(self._scale_blocks):
+            part = out[2 * n * i:2 * n * (i + 1)]
+            start = (self.blocks - min(n_blocks, self.blocks)) % self._capacity
+            count = self._cum_count[cur] - self._cum_count[start]
+            if count == 0:
+                part.fill(0.0)
+                continue
+            means = part[:n]
+            var = part[n:]
+            np.subtract(self._cum_sum[cur], self._cum_sum[start], out=means)
+            np.subtract(self._cum_sumsq[cur], self._cum_sumsq[start], out=var)
+            means /= count
+            if count > 1:
+                var -= means * means * count
+                var /= count - 1
+                np.maximum(var, 0.0, out=var)
+            else:
+                var.fill(0.0)
+            means += self._shift
+        return out
+
+
+if __name__ == "__main__":
+    # Check against the deque + np.mean/np.var(ddof=1) computation used before.
+    from collections import deque
+    import time
+
+    rng = np.random.default_rng(0)
+    window_size = 60
+    window = RollingWindow(window_size)
+    reference = {c: deque(maxlen=window_size) for c in CHANNELS}
+    offsets = np.array([1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 4.0, 400.0, 1.3, 0.5, 4.3, 0.4])
+    scales = np.array([0.01, 0.01, 0.01, 0.5, 0.5, 0.5, 0.1, 0.05, 0.05, 0.02, 0.1, 0.02])
+
+    worst = 0.0
+    for i in range(5000):
+        if i in (777, 3001):
+            window.reset()
+            reference = {c: deque(maxlen=window_size) for c in CHANNELS}
+        sample = offsets + scales * rng.standard_normal(len(CHANNELS))
+        window.append(sample)
+        for c, v in zip(CHANNELS, sample):
+            reference[c].append(v)
+        if i % 7 == 0:
+            count = len(reference['Ax'])
+            expected = [np.mean(reference[c]) for c in CHANNELS]
+            expected += [np.var(reference[c], ddof=1) if count > 1 else 0.0 for c in CHANNELS]
+            got = window.features()
+            assert window.count == count
+            assert np.allclose(got, expected, rtol=1e-9, atol=1e-12), (i, got, expected)
+            worst = max(worst, np.max(np.abs(got - expected)))
+    print(f"RollingWindow matches deque/NumPy output (max abs diff {worst:.3e})")
+
+    n_iter = 20000
+    start = time.perf_counter()
+    for i in range(n_iter):
+        window.append(sample)
+        window.features()
+    new_us = (time.perf_counter() - start) / n_iter * 1e6
+
+    start = time.perf_counter()
+    for i in range(n_iter):
+        for c, v in zip(CHANNELS, sample):
+            reference[c].append(v)
+        [np.mean(reference[c]) for c in CHANNELS]
+        [np.var(reference[c], ddof=1) for c in CHANNELS]
+    old_us = (time.perf_counter() - start) / n_iter * 1e6
+    print(f"append+features: {new_us:.1f} us, deque+np.mean/np.var: {old_us:.1f} us")
+
+    # Multi-scale windows against direct NumPy over the same blocks, with a slow
+    # co2 build-up so the shift has to follow the signal
+    scales = [1, 3, 10, 60]
+    multi = MultiScaleWindow(scales, rate=20)
+    noise = np.array([0.01] * 6 + [0.1] * 6)
+    samples = offsets + noise * rng.standard_normal((20 * 600, 12))
+    samples[:, 7] += np.linspace(0, 600, len(samples))
+    worst = 0.0
+    for i, sample in enumerate(samples):
+        multi.append(sample)
+        if i % 97 == 0 and multi.blocks:
+            got = multi.features()
+            complete = samples[:multi.blocks * 20]
+            for j, scale in enumerate(scales):
+                span = complete[-scale * 20:]
+                expected = np.concatenate([span.mean(axis=0), span.var(axis=0, ddof=1)])
+                part = got[24 * j:24 * (j + 1)]
+                assert np.allclose(part, expected, rtol=1e-7, atol=1e-10), (i, scale)
+                worst = max(worst, np.max(np.abs(part - expected) / np.maximum(np.abs(expected), 1e-3)))
+    print(f"MultiScaleWindow matches NumPy on {len(scales)} scales (max rel diff {worst:.1e})")
+
+    for n_scales in (1, 4, 8):
+        multi = MultiScaleWindow([1, 3, 10, 60, 120, 300, 600, 1800][:n_scales], rate=20)
+        start = time.perf_counter()
+        for i in range(n_iter):
+            multi.append(sample)
+        per_sample = (time.perf_counter() - start) / n_iter * 1e6
+        print(f"{n_scales} scale(s): append {per_sample:.1f} us/sample")
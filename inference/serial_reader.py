@@ -0,0 +1,138 @@
+# serial_reader.py
+import threading
+import time
+import numpy as np
+
+
+class TimestampedRing:
+    """Fixed-capacity ring of (monotonic timestamp, values) rows.
+
+    One thread appends, others look values up by time. Timestamps must be
+    non-decreasing. Lookups scan back from the newest entry, which is O(1) for
+    the usual "what was the value just now" query.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self._t = np.zeros(capacity)
+        self._values = np.zeros((capacity, width))
+        self._head = 0
+        self.count = 0
+        self.overwritten = 0
+        self._lock = threading.Lock()
+
+    def append(self, t, values):
+        with self._lock:
+            self._t[self._head] = t
+            self._values[self._head] = values
+            self._head = (self._head + 1) % self.capacity
+            if self.count == self.capacity:
+                self.overwritten += 1
+            else:
+                self.count += 1
+
+    def _index(self, age):
+        # age 0 is the newest entry
+        return (self._head - 1 - age) % self.capacity
+
+    def latest(self):
+        """Return (t, values) of the newest entry, or None if empty."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            i = self._index(0)
+            return self._t[i], self._values[i].copy()
+
+    def at(self, t, interpolate=False):
+        """Value at time t: the last entry at or before t, or linearly
+        interpolated between the entries around t. Times past the newest entry
+        hold its value; times before the oldest return the oldest."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            newer = None
+            for age in range(self.count):
+                i = self._index(age)
+                if self._t[i] <= t:
+                    if not interpolate or newer is None or self._t[newer] == self._t[i]:
+                        return self._values[i].copy()
+                    w = (t - self._t[i]) / (self._t[newer] - self._t[i])
+                    return self._values[i] + w * (self._values[newer] - self._values[i])
+                newer = i
+            return self._values[newer].copy()
+
+
+class StreamStats:
+    """Sample/drop counters and a smoothed rate for one sensor stream."""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.dropped = 0
+        self._last_t = None
+        self._mean_dt = None
+
+    def sample(self, t):
+        self.samples += 1
+        if self._last_t is not None:
+            dt = t - self._last_t
+            self._mean_dt = dt if self._mean_dt is None else 0.9 * self._mean_dt + 0.1 * dt
+        self._last_t = t
+
+    def drop(self):
+        self.dropped += 1
+
+    def as_dict(self):
+        rate = 1.0 / self._mean_dt if self._mean_dt else 0.0
+        return {'samples': self.samples, 'dropped': self.dropped, 'rate_hz': round(rate, 2)}
+
+
+def parse_gas_line(line, n_values=6):
+    """Parse 'co,co2,alcohol,toluen,nh4,acetone' from the Arduino; None if malformed."""
+    try:
+        values = tuple(map(float, line.decode('utf-8').strip().split(',')))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return values if len(values) == n_values else None
+
+
+class SerialReader(threading.Thread):
+    """Reads gas sensor lines in the background into a TimestampedRing.
+
+    Lines are stamped with time.monotonic() on arrival. Malformed lines count as
+    drops; read timeouts (no line within the port timeout) are counted too.
+    """
+
+    def __init__(self, ser, capacity=256, width=6, parse=parse_gas_line):
+        super().__init__(daemon=True)
+        self.ser = ser
+        self.parse = parse
+        self.ring = TimestampedRing(capacity, width)
+        self.stats = StreamStats('gas')
+        self.timeouts = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                line = self.ser.readline()
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                print(f"Error reading serial port: {e}")
+                time.sleep(0.1)
+                continue
+            t = time.monotonic()
+            if not line:
+                self.timeouts += 1
+                continue
+            values = self.parse(line)
+            if values is None:
+                self.stats.drop()
+                print(f"Invalid gas sensor data: {line!r}")
+                continue
+            self.ring.append(t, values)
+            self.stats.sample(t)
+
+    def stop(self):
+        self._stop_event.set()
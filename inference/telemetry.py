@@ -0,0 +1,180 @@
+# telemetry.py
+import atexit
+import csv
+import io
+import json
+import os
+import threading
+import time
+import numpy as np
+
+BINARY_MAGIC = b'TELEMv1\n'
+
+
+class TelemetryWriter:
+    """Buffered, rotating writer for the per-window rows.
+
+    Rows are kept in memory and written out when flush_rows have accumulated or
+    the oldest buffered row is flush_interval seconds old (a background thread
+    covers the case where rows stop arriving). Every flush is fsynced, so a power
+    cut loses at most one flush interval. The active file keeps its name;
+    when it grows past rotate_bytes or the day changes it is renamed to
+    <name>-YYYYmmdd-HHMMSS<ext> and a fresh file is started.
+
+    fmt='csv' writes the same CSV as before; fmt='binary' writes fixed-width
+    records (19-byte timestamp followed by float64 values) after a small JSON
+    header describing the layout, readable with read_binary().
+    """
+
+    def __init__(self, path, columns, fmt='csv', flush_rows=20, flush_interval=30.0,
+                 rotate_bytes=None, rotate_daily=False):
+        if fmt not in ('csv', 'binary'):
+            raise ValueError(f"Unknown telemetry format: {fmt}")
+        self.path = path
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.rows_written = 0
+        self.flushes = 0
+        self.rotations = 0
+        self._value_columns = [c for c in self.columns if c != 'timestamp']
+        self._dtype = np.dtype([('timestamp', 'S19')] + [(c, '<f8') for c in self._value_columns])
+        self._buffer = []
+        self._first_buffered = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._open()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _header(self):
+        if self.fmt == 'csv':
+            out = io.StringIO()
+            csv.writer(out, lineterminator="\n").writerow(self.columns)
+            return out.getvalue().encode('utf-8')
+        layout = json.dumps({'columns': self.columns, 'descr': self._dtype.descr}).encode('utf-8')
+        return BINARY_MAGIC + len(layout).to_bytes(4, 'little') + layout
+
+    def _open(self):
+        header = self._header()
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                existing = f.read(len(header))
+            if existing != header:
+                # Written with another layout or format; keep it but don't append to it
+                self._rotate_file()
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'ab')
+        if new_file:
+            self._file.write(header)
+            self._sync()
+        else:
+            self._repair_tail(len(header))
+        self._day = time.strftime("%Y%m%d")
+
+    def _repair_tail(self, header_len):
+        # After a power cut the last record may be incomplete; make sure new
+        # rows still start on a record boundary
+        size = os.path.getsize(self.path)
+        if self.fmt == 'binary':
+            torn = (size - header_len) % self._dtype.itemsize
+            if torn:
+                self._file.truncate(size - torn)
+        else:
+            with open(self.path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    self._file.write(b'\n')
+
+    def _rotate_file(self):
+        stem, ext = os.path.splitext(self.path)
+        rotated = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        suffix = 1
+        while os.path.exists(rotated):
+            rotated = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        print(f"Telemetry rotated to {rotated}")
+
+    def _maybe_rotate(self):
+        size = self._file.tell()
+        if ((self.rotate_bytes and size >= self.rotate_bytes)
+                or (self.rotate_daily and time.strftime("%Y%m%d") != self._day)):
+            self._file.close()
+            self._rotate_file()
+            self._open()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write(self, row):
+        """Buffer one row (a dict keyed by column name)."""
+        with self._lock:
+            if not self._buffer:
+                self._first_buffered = time.monotonic()
+            self._buffer.append(row)
+            due = (len(self._buffer) >= self.flush_rows
+                   or time.monotonic() - self._first_buffered >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def _encode(self, rows):
+        if self.fmt == 'csv':
+            out = io.StringIO()
+            writer = csv.writer(out, lineterminator="\n")
+            for row in rows:
+                writer.writerow([row.get(c, '') for c in self.columns])
+            return out.getvalue().encode('utf-8')
+        records = np.zeros(len(rows), dtype=self._dtype)
+        records['timestamp'] = [str(row.get('timestamp', '')).encode('ascii') for row in rows]
+        for c in self._value_columns:
+            records[c] = [row.get(c, np.nan) for row in rows]
+        return records.tobytes()
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer or self._file is None:
+                return
+            rows, self._buffer = self._buffer, []
+            self._maybe_rotate()
+            self._file.write(self._encode(rows))
+            self._sync()
+            self.rows_written += len(rows)
+            self.flushes += 1
+
+    def _flush_periodically(self):
+        while not self._stop_event.wait(min(self.flush_interval, 1.0)):
+            with self._lock:
+                due = self._buffer and time.monotonic() - self._first_buffered >= self.flush_interval
+            if due:
+                self.flush()
+
+    def close(self):
+        self._stop_event.set()
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_binary(path):
+    """Read a binary telemetry file back as a NumPy structured array."""
+    with open(path, 'rb') as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary telemetry file")
+        layout_len = int.from_bytes(f.read(4), 'little')
+        layout = json.loads(f.read(layout_len))
+        dtype = np.dtype([tuple(field) for field in layout['descr']])
+        data = f.read()
+    # A record cut short by a power failure is dropped
+    usable = len(data) - len(data) % dtype.itemsize
+    return np.frombuffer(data[:usable], dtype=dtype)
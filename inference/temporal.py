@@ -0,0 +1,230 @@
+# temporal.py
+import numpy as np
+
+
+class EyeMouthState:
+    """Result of one TemporalEngine.update()."""
+
+    __slots__ = ('closed_for', 'mouth_open_for', 'perclos', 'blinks_per_minute', 'coverage', 'drowsy', 'yawning')
+
+    def __init__(self, closed_for, mouth_open_for, perclos, blinks_per_minute, coverage, drowsy, yawning):
+        self.closed_for = closed_for
+        self.mouth_open_for = mouth_open_for
+        self.perclos = perclos
+        self.blinks_per_minute = blinks_per_minute
+        self.coverage = coverage
+        self.drowsy = drowsy
+        self.yawning = yawning
+
+    def __repr__(self):
+        return (f"EyeMouthState(closed_for={self.closed_for:.2f}, mouth_open_for={self.mouth_open_for:.2f}, "
+                f"perclos={self.perclos:.3f}, blinks_per_minute={self.blinks_per_minute:.1f}, "
+                f"drowsy={self.drowsy}, yawning={self.yawning})")
+
+
+class TemporalEngine:
+    """Eye-closure, PERCLOS, blink and yawn measures on timestamps rather than frame counts.
+
+    Each update(t, ear, mouth) stores the frame's EAR and lip distance in a
+    NumPy ring buffer. Eyes count as closed while EAR < ear_thresh and the mouth
+    as open while the lip distance > yawn_thresh. Frames without a face are not
+    recorded, so a run of closed eyes spans from its first to its latest closed
+    frame; a gap between samples longer than the gap limit (face lost) ends
+    the run, and gaps are left out of PERCLOS and its coverage. The limit is
+    max_gap seconds if given, otherwise gap_periods times the median of the
+    last 32 sample intervals (at least min_gap, and just min_gap until 8
+    intervals are known), so it follows the frame rate the loop achieves.
+
+    - drowsy: eyes closed for closed_seconds, or PERCLOS (time-weighted share of
+      the last perclos_window seconds with eyes closed) >= perclos_thresh once at
+      least perclos_min_coverage seconds are in the window;
+    - yawning: mouth open for yawn_seconds;
+    - blinks_per_minute: closed runs shorter than blink_max_seconds in the window.
+
+    Alerts therefore fire at most one frame interval after the time threshold,
+    whatever the frame rate.
+    """
+
+    def __init__(self, ear_thresh=0.30, yawn_thresh=20.0, closed_seconds=3.0, yawn_seconds=1.0,
+                 perclos_window=60.0, perclos_thresh=0.3, perclos_min_coverage=30.0,
+                 blink_max_seconds=0.5, max_gap=None, gap_periods=4.0, min_gap=1.0, capacity=4096):
+        self.ear_thresh = ear_thresh
+        self.yawn_thresh = yawn_thresh
+        self.closed_seconds = closed_seconds
+        self.yawn_seconds = yawn_seconds
+        self.perclos_window = perclos_window
+        self.perclos_thresh = perclos_thresh
+        self.perclos_min_coverage = perclos_min_coverage
+        self.blink_max_seconds = blink_max_seconds
+        self.max_gap = max_gap
+        self.gap_periods = gap_periods
+        self.min_gap = min_gap
+        self.capacity = capacity
+        self._t = np.zeros(capacity)
+        self._ear = np.zeros(capacity)
+        self._mouth = np.zeros(capacity)
+        self.reset()
+
+    def reset(self):
+        self._pos = 0
+        self.count = 0
+        self._closed_since = None
+        self._open_since = None
+        self._last_t = None
+        self.gap_limit = self.min_gap if self.max_gap is None else self.max_gap
+
+    def _update_gap_limit(self):
+        if self.max_gap is not None or self.count < 9:
+            return
+        # Newest first, so the differences are the recent intervals negated
+        recent = self._t[(self._pos - 1 - np.arange(min(self.count, 33))) % self.capacity]
+        self.gap_limit = max(self.min_gap, self.gap_periods * float(np.median(-np.diff(recent))))
+
+    def _window(self, since):
+        """Chronological (t, ear, mouth) views/copies for samples at or after `since`."""
+        n = self.count
+        if n < self.capacity:
+            t, ear, mouth = self._t[:n], self._ear[:n], self._mouth[:n]
+        else:
+            order = np.roll(np.arange(self.capacity), -self._pos)
+            t, ear, mouth = self._t[order], self._ear[order], self._mouth[order]
+        start = np.searchsorted(t, since)
+        return t[start:], ear[start:], mouth[start:]
+
+    def window_stats(self, now):
+        """(perclos, blinks_per_minute, coverage seconds) over the last perclos_window seconds."""
+        t, ear, _ = self._window(now - self.perclos_window)
+        if len(t) < 2:
+            return 0.0, 0.0, 0.0
+        closed = ear < self.ear_thresh
+        dt = np.diff(t)
+        gaps = dt > self.gap_limit
+        # Time without a face is neither closed nor open
+        dt[gaps] = 0.0
+        coverage = float(dt.sum())
+        perclos = float(dt[closed[:-1]].sum() / coverage) if coverage > 0 else 0.0
+        # Closed runs: starts where closed begins, ends where it stops
+        edges = np.diff(np.concatenate(([0], closed.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        # A run cut by a gap may have gone on while the face was lost: not a blink
+        gaps_before = np.concatenate(([0], np.cumsum(gaps)))
+        complete = (ends < len(t)) & (gaps_before[ends - 1] == gaps_before[starts])
+        durations = t[ends[complete]] - t[starts[complete]]
+        blinks = int(np.count_nonzero(durations <= self.blink_max_seconds))
+        minutes = coverage / 60.0
+        return perclos, (blinks / minutes if minutes > 0 else 0.0), coverage
+
+    def update(self, t, ear, mouth):
+        """Record one frame (t in seconds, e.g. time.monotonic()) and return the EyeMouthState."""
+        self._update_gap_limit()
+        i = self._pos
+        self._t[i] = t
+        self._ear[i] = ear
+        self._mouth[i] = mouth
+        self._pos = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        if self._last_t is not None and t - self._last_t > self.gap_limit:
+            # The face was lost in between: runs restart here
+            self._closed_since = None
+            self._open_since = None
+        self._last_t = t
+
+        if ear < self.ear_thresh:
+            if self._closed_since is None:
+                self._closed_since = t
+        else:
+            self._closed_since = None
+        if mouth > self.yawn_thresh:
+            if self._open_since is None:
+                self._open_since = t
+        else:
+            self._open_since = None
+
+        closed_for = 0.0 if self._closed_since is None else t - self._closed_since
+        mouth_open_for = 0.0 if self._open_since is None else t - self._open_since
+        perclos, blink_rate, coverage = self.window_stats(t)
+        drowsy = (closed_for >= self.closed_seconds
+                  or (coverage >= self.perclos_min_coverage and perclos >= self.perclos_thresh))
+        yawning = mouth_open_for >= self.yawn_seconds
+        return EyeMouthState(closed_for, mouth_open_for, perclos, blink_rate, coverage, drowsy, yawning)
+
+
+if __name__ == "__main__":
+    # Replay the same scripted drive at several frame rates (with jittery frame
+    # times) and check the alert latency is bounded in seconds, unlike the
+    # 90-frame counter it replaces.
+    rng = np.random.default_rng(0)
+    CLOSE_AT, CLOSE_FOR = 20.0, 6.0
+    YAWN_AT, YAWN_FOR = 40.0, 4.0
+
+    def scripted(t):
+        # Open eyes with a blink every 4 s, one long closure and one yawn
+        ear = 0.33
+        if t % 4.0 < 0.2 or CLOSE_AT <= t < CLOSE_AT + CLOSE_FOR:
+            ear = 0.2
+        mouth = 30.0 if YAWN_AT <= t < YAWN_AT + YAWN_FOR else 8.0
+        return ear, mouth
+
+    for fps in (3, 5, 10, 30):
+        engine = TemporalEngine()
+        t = 0.0
+        counter = 0
+        first = {'drowsy': None, 'yawning': None, 'counter': None}
+        blink_rate = None
+        while t < 60.0:
+            ear, mouth = scripted(t)
+            state = engine.update(t, ear, mouth)
+            if state.drowsy and first['drowsy'] is None and t >= CLOSE_AT:
+                first['drowsy'] = t
+            if state.yawning and first['yawning'] is None:
+                first['yawning'] = t
+            # Previous logic: 30*3 consecutive low-EAR frames
+            counter = counter + 1 if ear < 0.30 else 0
+            if counter >= 30 * 3 and first['counter'] is None:
+                first['counter'] = t
+            if abs(t - 19.0) < 1.0 / fps and blink_rate is None:
+                blink_rate = state.blinks_per_minute
+            t += rng.uniform(0.5, 1.5) / fps
+
+        frame_bound = 1.5 / fps
+        drowsy_latency = first['drowsy'] - CLOSE_AT
+        yawn_latency = first['yawning'] - YAWN_AT
+        assert engine.closed_seconds <= drowsy_latency <= engine.closed_seconds + 2 * frame_bound, (fps, drowsy_latency)
+        assert engine.yawn_seconds <= yawn_latency <= engine.yawn_seconds + 2 * frame_bound, (fps, yawn_latency)
+        counter_latency = 'never' if first['counter'] is None else f"{first['counter'] - CLOSE_AT:.2f} s"
+        print(f"{fps:>2} fps: drowsy after {drowsy_latency:.2f} s, yawn after {yawn_latency:.2f} s, "
+              f"blinks {blink_rate:.0f}/min (frame counter: {counter_latency})")
+
+    # Face lost mid-blink: closed frames either side of a 3.2 s dropout are
+    # two short closures, not 3 s of closed eyes
+    for fps in (3, 10, 30):
+        engine = TemporalEngine()
+        t, state, alerts = 0.0, None, 0
+        while t < 40.0:
+            if not 10.0 < t < 13.2:
+                ear = 0.2 if 9.8 <= t < 13.4 else 0.33
+                state = engine.update(t, ear, 8.0)
+                alerts += state.drowsy
+            t += rng.uniform(0.5, 1.5) / fps
+        assert alerts == 0 and state.perclos < 0.1, (fps, alerts, state)
+        print(f"{fps:>2} fps: no alert across a 3.2 s face dropout ({state})")
+    engine = TemporalEngine()
+    engine.update(0.0, 0.2, 5.0)
+    state = engine.update(3.2, 0.2, 5.0)
+    assert not state.drowsy and state.closed_for == 0.0 and state.perclos == 0.0, state
+
+    # Below 1 fps (loaded Pi, HOG with upsampling) every interval is over a
+    # second; the gap limit follows the frame period so the closed-eyes alert
+    # still fires within a couple of frames of closed_seconds
+    for fps in (0.5, 0.8):
+        engine = TemporalEngine()
+        t, first = 0.0, None
+        while t < 120.0:
+            ear = 0.2 if 60.0 <= t < 75.0 else 0.33
+            if engine.update(t, ear, 8.0).drowsy and first is None:
+                first = t
+            t += rng.uniform(0.8, 1.2) / fps
+        latency = first - 60.0
+        assert engine.closed_seconds <= latency <= engine.closed_seconds + 2 * 1.2 / fps, (fps, latency)
+        print(f"{fps:>4} fps: drowsy after {latency:.2f} s (gap limit {engine.gap_limit:.1f} s)")
@@ -0,0 +1,311 @@
+# vision_pipeline.py
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+FREE, WRITING, READY, READING = 0, 1, 2, 3
+
+# Per-stage counters kept in shared memory
+CAPTURED, OVERWRITTEN, DETECTED, SKIPPED, RESULTS_DROPPED, CONSUMED = range(6)
+COUNTER_NAMES = ('captured', 'overwritten', 'detected', 'skipped', 'results_dropped', 'consumed')
+
+
+class FrameRing:
+    """Fixed set of grayscale frame slots in one shared-memory block.
+
+    The writer fills a free slot (or, if none is free, the oldest unread one)
+    and publishes it; a reader claims the newest published frame, skipping any
+    older unread ones (latest frame wins), and works on it in place until it
+    releases the slot. Slot states and sequence numbers live in the same block
+    and are only changed under the claim lock, so frames are never copied
+    between processes and never torn.
+    """
+
+    def __init__(self, shape, slots=4, name=None, lock=None, create=True):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = slots * 3 * 8
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.state = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=0)
+        self.seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=slots * 8)
+        self.stamp = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=slots * 16)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=header_bytes)
+        self.cond = lock if lock is not None else mp.get_context('spawn').Condition()
+        if create:
+            self.state[:] = FREE
+            self.seq[:] = -1
+        self._next_seq = 0
+
+    @classmethod
+    def attach(cls, name, shape, slots, cond):
+        return cls(shape, slots, name=name, lock=cond, create=False)
+
+    def put(self, frame, t):
+        """Copy a frame into a slot and publish it; returns (seq, True if an unread frame was overwritten)."""
+        with self.cond:
+            free = np.flatnonzero(self.state == FREE)
+            if len(free):
+                slot, overwritten = free[0], False
+            else:
+                ready = np.flatnonzero(self.state == READY)
+                slot, overwritten = ready[np.argmin(self.seq[ready])], True
+            self.state[slot] = WRITING
+        np.copyto(self.frames[slot], frame)
+        with self.cond:
+            seq = self._next_seq
+            self.seq[slot] = seq
+            self.stamp[slot] = t
+            self.state[slot] = READY
+            self._next_seq += 1
+            self.cond.notify_all()
+        return seq, overwritten
+
+    def claim_latest(self, timeout=None):
+        """Claim the newest published frame: returns (slot, seq, t, frame view, skipped) or None."""
+        with self.cond:
+            ready = np.flatnonzero(self.state == READY)
+            if not len(ready):
+                self.cond.wait(timeout)
+                ready = np.flatnonzero(self.state == READY)
+                if not len(ready):
+                    return None
+            slot = ready[np.argmax(self.seq[ready])]
+            # Older unread frames are stale now; hand their slots back to the writer
+            stale = ready[ready != slot]
+            self.state[stale] = FREE
+            self.state[slot] = READING
+            return slot, int(self.seq[slot]), float(self.stamp[slot]), self.frames[slot], len(stale)
+
+    def release(self, slot):
+        with self.cond:
+            self.state[slot] = FREE
+
+    def close(self, unlink=False):
+        # Drop the views before closing the mapping
+        self.state = self.seq = self.stamp = self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _detection_stage(ring_name, shape, slots, cond, counters, results, stop_event,
+                     cascade_path, predictor_path, track_mode, detect_every, landmark_flow, seat_x,
+                     detector_name, face_size, hog_upsample):
+    """Detection + landmarks process: newest frame in, (seq, t, [68x2 landmarks]) out."""
+    import dlib
+    from face_tracker import DriverSelector, FaceTracker
+    from face_detectors import make_detector
+    from landmarks import LandmarkFlow, shape_into
+
+    ring = FrameRing.attach(ring_name, shape, slots, cond)
+    detector = make_detector(detector_name, cascade_path, face_size, hog_upsample)
+    predictor = dlib.shape_predictor(predictor_path)
+    selector = DriverSelector(seat_x=seat_x)
+    tracker = (FaceTracker(detector, mode=track_mode, detect_every=detect_every, selector=selector)
+               if track_mode else None)
+    flow = LandmarkFlow(predictor) if landmark_flow and tracker is not None else None
+    landmarks = np.zeros((68, 2), dtype=np.int32)
+    try:
+        while not stop_event.is_set():
+            claimed = ring.claim_latest(timeout=0.5)
+            if claimed is None:
+                continue
+            slot, seq, t, gray, skipped = claimed
+            try:
+                if tracker is not None:
+                    rects = tracker.update(gray)
+                else:
+                    rects = detector.detect(gray)
+                    driver = selector.select(rects, gray.shape)
+                    rects = [] if driver is None else [driver]
+                shapes = []
+                if flow is not None and not len(rects):
+                    flow.reset()
+                for (x, y, w, h) in rects:
+                    if flow is not None:
+                        flow.update(gray, (x, y, w, h), t, landmarks)
+                    else:
+                        shape_into(predictor(gray, dlib.rectangle(int(x), int(y), int(x + w), int(y + h))), landmarks)
+                    if tracker is not None:
+                        tracker.update_landmarks(landmarks)
+                    # The queue pickles in its feeder thread, after the buffer is refilled
+                    shapes.append(landmarks.copy())
+            finally:
+                ring.release(slot)
+            with counters.get_lock():
+                counters[DETECTED] += 1
+                counters[SKIPPED] += skipped
+            try:
+                results.put_nowait((seq, t, shapes))
+            except queue.Full:
+                with counters.get_lock():
+                    counters[RESULTS_DROPPED] += 1
+    finally:
+        ring.close()
+
+
+class VisionPipeline:
+    """Capture -> detection/landmarks (own process) -> consumer.
+
+    A capture thread pulls grayscale frames from `camera` into a FrameRing; a
+    spawned process runs the Haar/tracker + dlib landmark stage on the newest
+    frame and sends back the landmarks; results() yields (seq, t, shapes) for
+    the temporal engine and alerts in this process, and frame(seq) still has
+    the captured frame for a little while (references only) if it is to be
+    drawn on. Frames the detection stage couldn't keep up with are skipped
+    rather than queued. Counters for every stage are shared so stats() can
+    show per-stage throughput.
+    """
+
+    def __init__(self, camera, cascade_path="haarcascade_frontalface_default.xml",
+                 predictor_path="shape_predictor_68_face_landmarks.dat", track_mode="correlation",
+                 detect_every=10, slots=4, frame_shape=None, landmark_flow=False, seat_x=0.5, detector="haar",
+                 face_size=None, hog_upsample=1):
+        self.camera = camera
+        self.cascade_path = cascade_path
+        self.predictor_path = predictor_path
+        self.track_mode = track_mode
+        self.detect_every = detect_every
+        self.landmark_flow = landmark_flow
+        self.seat_x = seat_x
+        self.detector = detector
+        self.face_size = face_size
+        self.hog_upsample = hog_upsample
+        self.slots = slots
+        self.frame_shape = frame_shape
+        self._ctx = mp.get_context('spawn')
+        self.counters = self._ctx.Array('q', len(COUNTER_NAMES))
+        self.results_queue = self._ctx.Queue(maxsize=8)
+        self._stop_event = self._ctx.Event()
+        self._capture_done = threading.Event()
+        self.ring = None
+        self._process = None
+        self._capture_thread = None
+        self._first_frame = None
+        self._recent = {}
+        self._started = None
+
+    def start(self):
+        first = self.camera.capture_gray()
+        if first is None:
+            raise RuntimeError("Camera returned no frames")
+        shape = self.frame_shape or first.shape
+        self.ring = FrameRing(shape, self.slots, lock=self._ctx.Condition())
+        self._process = self._ctx.Process(
+            target=_detection_stage, daemon=True,
+            args=(self.ring.name, shape, self.slots, self.ring.cond, self.counters, self.results_queue,
+                  self._stop_event, self.cascade_path, self.predictor_path, self.track_mode, self.detect_every,
+                  self.landmark_flow, self.seat_x, self.detector, self.face_size,
+                  self.hog_upsample))
+        self._process.start()
+        self._first_frame = first
+        self._started = time.monotonic()
+        self._capture_thread = threading.Thread(target=self._capture, daemon=True)
+        self._capture_thread.start()
+        return self
+
+    def _capture(self):
+        frame = self._first_frame
+        self._first_frame = None
+        while frame is not None and not self._stop_event.is_set():
+            seq, overwritten = self.ring.put(frame, time.monotonic())
+            self._recent[seq] = frame
+            self._recent.pop(seq - self.slots - 4, None)
+            with self.counters.get_lock():
+                self.counters[CAPTURED] += 1
+                self.counters[OVERWRITTEN] += overwritten
+            frame = self.camera.capture_gray()
+        self._capture_done.set()
+
+    def frame(self, seq):
+        """The captured frame with this sequence number, if it is still held."""
+        return self._recent.get(seq)
+
+    def results(self, idle_timeout=5.0):
+        """Yield (seq, t, shapes) per processed frame until stopped, or until the camera
+        has run out and nothing arrived for idle_timeout seconds."""
+        idle_since = None
+        while not self._stop_event.is_set():
+            try:
+                seq, t, shapes = self.results_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    print("Detection process exited")
+                    return
+                if self._capture_done.is_set():
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > idle_timeout:
+                        return
+                continue
+            idle_since = None
+            with self.counters.get_lock():
+                self.counters[CONSUMED] += 1
+            yield seq, t, shapes
+
+    def stats(self):
+        elapsed = max(time.monotonic() - (self._started or time.monotonic()), 1e-9)
+        values = dict(zip(COUNTER_NAMES, self.counters[:]))
+        values['capture_fps'] = round(values['captured'] / elapsed, 1)
+        values['detect_fps'] = round(values['detected'] / elapsed, 1)
+        values['consume_fps'] = round(values['consumed'] / elapsed, 1)
+        return values
+
+    def stop(self):
+        self._stop_event.set()
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=2.0)
+        if self._process is not None:
+            self._process.join(timeout=5.0)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+
+if __name__ == "__main__":
+    # Same clip through the single-threaded loop body and through the pipeline
+    import argparse
+    import cv2
+    import dlib
+    from imutils import face_utils
+    from camera import FakeCamera
+    from face_tracker import FaceTracker
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("video")
+    ap.add_argument("--fps", type=float, default=30.0, help="camera frame rate to simulate")
+    ap.add_argument("--cascade", default="haarcascade_frontalface_default.xml")
+    ap.add_argument("--predictor", default="shape_predictor_68_face_landmarks.dat")
+    args = ap.parse_args()
+
+    camera = FakeCamera(args.video, fps=args.fps)
+    detector = cv2.CascadeClassifier(args.cascade)
+    predictor = dlib.shape_predictor(args.predictor)
+    tracker = FaceTracker(detector)
+    processed = 0
+    start = time.monotonic()
+    while True:
+        gray = camera.capture_gray()
+        if gray is None:
+            break
+        for (x, y, w, h) in tracker.update(gray):
+            shape = face_utils.shape_to_np(predictor(gray, dlib.rectangle(x, y, x + w, y + h)))
+            tracker.update_landmarks(shape)
+        processed += 1
+    elapsed = time.monotonic() - start
+    print(f"single thread: {processed} of {camera.frames} frames processed, {processed / elapsed:.1f} fps")
+
+    pipeline = VisionPipeline(FakeCamera(args.video, fps=args.fps), args.cascade, args.predictor).start()
+    faces = sum(bool(shapes) for _, _, shapes in pipeline.results(idle_timeout=1.0))
+    print(f"pipeline: {pipeline.stats()}, {faces} frames with a face")
+    pipeline.stop()
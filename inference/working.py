@@ -1,123 +1,48 @@
 # working.py
-import smbus
-import serial
+import argparse
 import time
 import numpy as np
-import pandas as pd
-from collections import deque
 from sklearn.preprocessing import StandardScaler
-import joblib
+import os
 import queue
+import threading
+from sensor_window import RollingWindow, MultiScaleWindow, FEATURE_COLUMNS
+from sensor_source import HardwareSource, ReplaySource, SyntheticSource, CaptureRecorder
+from inference_worker import LatestWindowQueue, InferenceWorker
+from scorer import CompiledScorer
+from model_registry import ModelRegistry
+from telemetry import TelemetryWriter
+from scheduler import DeadlineScheduler, POLICIES
 
 # Shared queue for alerts
 #alert_queue = queue.Queue()
 
 # --- Inference Functions ---
-def load_model_and_scaler(model_path='backup2.pkl', scaler_path='scaler.pkl'):
-    try:
-        model = joblib.load(model_path)
-        scaler = joblib.load(scaler_path)
-        print("Model and scaler loaded successfully.")
-        return model, scaler
-    except FileNotFoundError as e:
-        print(f"Error: {e}. Ensure model and scaler files exist.")
-        return None, None
-
-def preprocess_data_point(data_point, scaler):
-    if isinstance(data_point, dict):
-        df = pd.DataFrame([data_point])
-    else:
-        raise ValueError("Input data_point must be a dictionary.")
-
-    columns_to_drop = ['timestamp', 'sample_count', 'toluen_var', 'nh4_var', 'acetone_var',
-                       'toluen_mean', 'nh4_mean', 'acetone_mean', 'co_var', 'co2_var', 'alcohol_var']
-    features = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
-
-    if features.isnull().any().any():
-        print("Warning: Missing values detected. Filling with 0.")
-        features = features.fillna(0)
+# Prefer the flattened export (python flat_forest.py export) when it has been generated
+default_model_path = 'backup2.forest' if os.path.exists('backup2.forest') else 'backup2.pkl'
 
-    X = features.values
-    X_scaled = scaler.transform(X)
-    return X_scaled
-
-def predict_anomaly(model, X_scaled):
-    prediction = model.predict(X_scaled)
-    score = model.decision_function(X_scaled)
-    label = 'Anomaly' if prediction[0] == -1 else 'Normal'
-    return label, score[0]
-
-def inference_pipeline(data_point, model, scaler, alert_queue):
-    if model is None or scaler is None:
+def inference_pipeline(window_vector, scorer, alert_queue):
+    if scorer is None:
         print("Model or scaler not loaded. Skipping inference.")
         return None, None
-    X_scaled = preprocess_data_point(data_point, scaler)
-    label, score = predict_anomaly(model, X_scaled)
+    label, score = scorer.score_vector(window_vector)
     print(f"Prediction: {label}, Anomaly Score: {score:.6f}")
     if label == 'Anomaly':
         print("generating Alert")
         alert_queue.put(f"Anomaly detected at {time.strftime('%Y-%m-%d %H:%M:%S')}, Score: {score:.6f}")
-    time.sleep(5)
     return label, score
 
 # --- Sensor Data Collection ---
-try:
-    ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
-except serial.SerialException as e:
-    print(f"Serial connection failed: {e}")
-    exit(1)
-
-PWR_MGMT_1 = 0x6B
-SMPLRT_DIV = 0x19
-CONFIG = 0x1A
-GYRO_CONFIG = 0x1B
-INT_ENABLE = 0x38
-ACCEL_XOUT_H = 0x3B
-ACCEL_YOUT_H = 0x3D
-ACCEL_ZOUT_H = 0x3F
-GYRO_XOUT_H = 0x43
-GYRO_YOUT_H = 0x45
-GYRO_ZOUT_H = 0x47
-
-def MPU_Init():
-    try:
-        bus.write_byte_data(Device_Address, SMPLRT_DIV, 7)
-        bus.write_byte_data(Device_Address, PWR_MGMT_1, 1)
-        bus.write_byte_data(Device_Address, CONFIG, 0)
-        bus.write_byte_data(Device_Address, GYRO_CONFIG, 24)
-        bus.write_byte_data(Device_Address, INT_ENABLE, 1)
-    except Exception as e:
-        print(f"MPU6050 initialization failed: {e}")
-        exit(1)
-
-def read_raw_data(addr):
-    try:
-        high = bus.read_byte_data(Device_Address, addr)
-        low = bus.read_byte_data(Device_Address, addr + 1)
-        value = ((high << 8) | low)
-        if value > 32768:
-            value = value - 65536
-        return value
-    except Exception as e:
-        print(f"Error reading MPU6050 data: {e}")
-        return 0
-
-bus = smbus.SMBus(1)
-Device_Address = 0x68
-MPU_Init()
-
-# Load model and scaler at startup
-model, scaler = load_model_and_scaler()
+# Layout of the per-window feature vector handed to the scorer
+window_vector_columns = FEATURE_COLUMNS + ['mean_bpm']
 
-print("Reading Data of Gyroscope, Accelerometer, and Gas Sensors")
+# Load model and scaler once at startup; the registry swaps in new versions
+# pushed to disk without restarting
+model_registry = ModelRegistry(default_model_path, 'scaler.pkl',
+                               build=lambda model, scaler: CompiledScorer(model, scaler, window_vector_columns))
 
 window_size = 60
-data_window = {
-    'Ax': deque(maxlen=window_size), 'Ay': deque(maxlen=window_size), 'Az': deque(maxlen=window_size),
-    'Gx': deque(maxlen=window_size), 'Gy': deque(maxlen=window_size), 'Gz': deque(maxlen=window_size),
-    'co': deque(maxlen=window_size), 'co2': deque(maxlen=window_size), 'alcohol': deque(maxlen=window_size),
-    'toluen': deque(maxlen=window_size), 'nh4': deque(maxlen=window_size), 'acetone': deque(maxlen=window_size),
-}
+data_window = RollingWindow(window_size)
 
 csv_filename = 'test_data.csv'
 columns = [
@@ -129,149 +54,179 @@ columns = [
     'mean_bpm', 'sample_count'
 ]
 
-if not pd.io.common.file_exists(csv_filename):
-    pd.DataFrame(columns=columns).to_csv(csv_filename, index=False)
-
-last_save_time = time.time()
 fixed_bpm = 70.0
 
+# Optional longer/shorter time scales; their columns are appended after the
+# standard ones so existing rows and the model keep their layout
+multi_window = None
+
+def configure_scales(scales, rate=20.0):
+    """Add mean/var features over the given scales (seconds) to every window.
+
+    Call once, before run_sensor_loop and before the telemetry file is opened.
+    """
+    global multi_window, window_vector_columns, columns, row_columns
+    multi_window = MultiScaleWindow(scales, rate=rate)
+    window_vector_columns = window_vector_columns + multi_window.columns
+    columns = columns + multi_window.columns
+    row_columns = row_columns + multi_window.columns
+
 def reset_data_window():
     """Reset the data window to clear anomalous data."""
-    global data_window
-    data_window = {
-        'Ax': deque(maxlen=window_size), 'Ay': deque(maxlen=window_size), 'Az': deque(maxlen=window_size),
-        'Gx': deque(maxlen=window_size), 'Gy': deque(maxlen=window_size), 'Gz': deque(maxlen=window_size),
-        'co': deque(maxlen=window_size), 'co2': deque(maxlen=window_size), 'alcohol': deque(maxlen=window_size),
-        'toluen': deque(maxlen=window_size), 'nh4': deque(maxlen=window_size), 'acetone': deque(maxlen=window_size),
-    }
+    data_window.reset()
+    if multi_window is not None:
+        multi_window.reset()
     print("Data window reset after anomaly detection.")
 
-def run_sensor_loop(alert_queue):
-    global last_save_time, model, scaler
-    while True:
-        try:
-            acc_x = read_raw_data(ACCEL_XOUT_H)
-            acc_y = read_raw_data(ACCEL_YOUT_H)
-            acc_z = read_raw_data(ACCEL_ZOUT_H)
-            gyro_x = read_raw_data(GYRO_XOUT_H)
-            gyro_y = read_raw_data(GYRO_YOUT_H)
-            gyro_z = read_raw_data(GYRO_ZOUT_H)
-
-            Ax = acc_x / 16384.0
-            Ay = acc_y / 16384.0
-            Az = acc_z / 16384.0
-            Gx = gyro_x / 131.0
-            Gy = gyro_y / 131.0
-            Gz = gyro_z / 131.0
+# Order of the values in each saved row
+row_columns = [
+    'timestamp',
+    'Ax_mean', 'Ay_mean', 'Az_mean', 'Gx_mean', 'Gy_mean', 'Gz_mean',
+    'Ax_var', 'Ay_var', 'Az_var', 'Gx_var', 'Gy_var', 'Gz_var',
+    'co_mean', 'co2_mean', 'alcohol_mean', 'toluen_mean', 'nh4_mean', 'acetone_mean',
+    'co_var', 'co2_var', 'alcohol_var', 'toluen_var', 'nh4_var', 'acetone_var',
+    'sample_count', 'mean_bpm'
+]
 
-            read_serial = ser.readline()
-            gases = read_serial.decode('utf-8').strip()
-            try:
-                co, co2, alcohol, toluen, nh4, acetone = map(float, gases.split(','))
-            except ValueError:
-                print(f"Invalid gas sensor data: {gases}")
-                time.sleep(0.05)
-                continue
+# Set by the inference worker, handled by the sampling thread which owns data_window
+reset_requested = threading.Event()
 
-            data_window['Ax'].append(Ax)
-            data_window['Ay'].append(Ay)
-            data_window['Az'].append(Az)
-            data_window['Gx'].append(Gx)
-            data_window['Gy'].append(Gy)
-            data_window['Gz'].append(Gz)
-            data_window['co'].append(co)
-            data_window['co2'].append(co2)
-            data_window['alcohol'].append(alcohol)
-            data_window['toluen'].append(toluen)
-            data_window['nh4'].append(nh4)
-            data_window['acetone'].append(acetone)
+def score_window(window_vector, alert_queue):
+    """Runs on the inference worker thread so sampling never waits for the model."""
+    label, score = inference_pipeline(window_vector, model_registry.current, alert_queue)
+    if label == 'Anomaly':
+        print("Anomaly detected. Resetting data window...")
+        reset_requested.set()
+    return label, score
 
-            current_time = time.time()
-            if current_time - last_save_time >= 3.0:
-                sample_count = len(data_window['Ax'])
+def open_hardware_source(align='latest', imu_rate=None):
+    try:
+        return HardwareSource(align=align, imu_rate=imu_rate)
+    except Exception as e:
+        print(f"Sensor hardware initialization failed: {e}")
+        return None
+
+def open_telemetry(fmt='csv'):
+    # Rows are matched to the header by name when written
+    path = csv_filename if fmt == 'csv' else os.path.splitext(csv_filename)[0] + '.bin'
+    return TelemetryWriter(path, columns, fmt=fmt, flush_rows=20, flush_interval=30.0,
+                           rotate_bytes=50 * 1024 * 1024, rotate_daily=True)
+
+def run_sensor_loop(alert_queue, source=None, telemetry=None, window_policy='skip'):
+    """Sample, window and score until the source runs out (hardware never does).
+
+    Window boundaries fall every 3 s of sample time on a fixed grid; windows
+    missed during a stall are handled by window_policy (see DeadlineScheduler).
+    """
+    if source is None:
+        source = open_hardware_source()
+        if source is None:
+            return
+    if model_registry.current is None:
+        model_registry.reload()
+        model_registry.start()
+    if telemetry is None:
+        telemetry = open_telemetry()
+    print("Reading Data of Gyroscope, Accelerometer, and Gas Sensors")
+
+    window_queue = LatestWindowQueue(maxsize=1)
+    worker = InferenceWorker(lambda vector: score_window(vector, alert_queue), window_queue)
+    worker.start()
+    window_clock = DeadlineScheduler(3.0, policy=window_policy)
+    n_samples = 0
+    n_windows = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            if reset_requested.is_set():
+                reset_requested.clear()
+                reset_data_window()
+
+            sample = source.read()
+            if sample is None:
+                break
+            sample_time, values = sample
+            n_samples += 1
+            data_window.append(values)
+            if multi_window is not None:
+                multi_window.append(values)
+
+            for _ in range(window_clock.poll(sample_time)):
+                sample_count = data_window.count
                 if sample_count > 0:
-                    means = {
-                        'Ax_mean': np.mean(data_window['Ax']),
-                        'Ay_mean': np.mean(data_window['Ay']),
-                        'Az_mean': np.mean(data_window['Az']),
-                        'Gx_mean': np.mean(data_window['Gx']),
-                        'Gy_mean': np.mean(data_window['Gy']),
-                        'Gz_mean': np.mean(data_window['Gz']),
-                        'co_mean': np.mean(data_window['co']),
-                        'co2_mean': np.mean(data_window['co2']),
-                        'alcohol_mean': np.mean(data_window['alcohol']),
-                        'toluen_mean': np.mean(data_window['toluen']),
-                        'nh4_mean': np.mean(data_window['nh4']),
-                        'acetone_mean': np.mean(data_window['acetone']),
-                        'mean_bpm': fixed_bpm
-                    }
-                    variances = {
-                        'Ax_var': np.var(data_window['Ax'], ddof=1) if sample_count > 1 else 0.0,
-                        'Ay_var': np.var(data_window['Ay'], ddof=1) if sample_count > 1 else 0.0,
-                        'Az_var': np.var(data_window['Az'], ddof=1) if sample_count > 1 else 0.0,
-                        'Gx_var': np.var(data_window['Gx'], ddof=1) if sample_count > 1 else 0.0,
-                        'Gy_var': np.var(data_window['Gy'], ddof=1) if sample_count > 1 else 0.0,
-                        'Gz_var': np.var(data_window['Gz'], ddof=1) if sample_count > 1 else 0.0,
-                        'co_var': np.var(data_window['co'], ddof=1) if sample_count > 1 else 0.0,
-                        'co2_var': np.var(data_window['co2'], ddof=1) if sample_count > 1 else 0.0,
-                        'alcohol_var': np.var(data_window['alcohol'], ddof=1) if sample_count > 1 else 0.0,
-                        'toluen_var': np.var(data_window['toluen'], ddof=1) if sample_count > 1 else 0.0,
-                        'nh4_var': np.var(data_window['nh4'], ddof=1) if sample_count > 1 else 0.0,
-                        'acetone_var': np.var(data_window['acetone'], ddof=1) if sample_count > 1 else 0.0,
-                    }
-
-                    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                    row = {
-                        'timestamp': timestamp,
-                        'Ax_mean': means['Ax_mean'],
-                        'Ay_mean': means['Ay_mean'],
-                        'Az_mean': means['Az_mean'],
-                        'Gx_mean': means['Gx_mean'],
-                        'Gy_mean': means['Gy_mean'],
-                        'Gz_mean': means['Gz_mean'],
-                        'Ax_var': variances['Ax_var'],
-                        'Ay_var': variances['Ay_var'],
-                        'Az_var': variances['Az_var'],
-                        'Gx_var': variances['Gx_var'],
-                        'Gy_var': variances['Gy_var'],
-                        'Gz_var': variances['Gz_var'],
-                        'co_mean': means['co_mean'],
-                        'co2_mean': means['co2_mean'],
-                        'alcohol_mean': means['alcohol_mean'],
-                        'toluen_mean': means['toluen_mean'],
-                        'nh4_mean': means['nh4_mean'],
-                        'acetone_mean': means['acetone_mean'],
-                        'co_var': variances['co_var'],
-                        'co2_var': variances['co2_var'],
-                        'alcohol_var': variances['alcohol_var'],
-                        'toluen_var': variances['toluen_var'],
-                        'nh4_var': variances['nh4_var'],
-                        'acetone_var': variances['acetone_var'],
-                        'sample_count': sample_count,
-                        'mean_bpm': fixed_bpm
-                    }
-
-                    df = pd.DataFrame([row])
-                    df.to_csv(csv_filename, mode='a', header=False, index=False)
-
-                    label, score = inference_pipeline(row, model, scaler, alert_queue)
-                    if label == 'Anomaly':
-                        print("Anomaly detected. Resetting data window and model...")
-                        reset_data_window()
-                        # Optionally reload model and scaler to reset state
-                        model, scaler = load_model_and_scaler()
-
-                last_save_time += 3.0
-
-            time.sleep(0.05)
+                    window_vector = np.empty(len(window_vector_columns))
+                    data_window.features(out=window_vector[:len(FEATURE_COLUMNS)])
+                    window_vector[len(FEATURE_COLUMNS)] = fixed_bpm
+                    if multi_window is not None:
+                        multi_window.features(out=window_vector[len(FEATURE_COLUMNS) + 1:])
+                    features = dict(zip(window_vector_columns, window_vector))
+                    features['sample_count'] = sample_count
+                    features['timestamp'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sample_time))
+                    row = {col: features[col] for col in row_columns}
+
+                    telemetry.write(row)
+
+                    window_queue.put(window_vector)
+
+                    n_windows += 1
+                    if n_windows % 20 == 0:
+                        print(f"Window schedule: {window_clock.stats()}")
+                        if source.stats():
+                            print(f"Sensor stats: {source.stats()}")
 
         except Exception as e:
             print(f"Error in sensor loop: {e}")
             time.sleep(0.1)
 
+    worker.wait_idle()
+    worker.stop()
+    telemetry.close()
+    elapsed = time.perf_counter() - started
+    print(f"Processed {n_samples} samples in {elapsed:.2f} s ({n_samples / max(elapsed, 1e-9):.0f} samples/s)")
+    print(f"Inference stats: {worker.stats()}")
+    print(f"Window schedule: {window_clock.stats()}")
+    if source.stats():
+        print(f"Sensor stats: {source.stats()}")
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replay", type=str, help="raw capture or window-level CSV (e.g. ../dataset/final.csv) to replay")
+    ap.add_argument("--synthetic", type=int, metavar="N", help="generate N synthetic samples instead of reading sensors")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed factor, 0 for as fast as possible")
+    ap.add_argument("--record", type=str, help="also save the raw samples to this CSV")
+    ap.add_argument("--telemetry-format", choices=["csv", "binary"], default="csv",
+                    help="write window rows as CSV or fixed-width binary records")
+    ap.add_argument("--align", choices=["latest", "interp"], default="latest",
+                    help="pair each IMU sample with the latest gas reading or interpolate between readings")
+    ap.add_argument("--imu-rate", type=float,
+                    help="sample the MPU6050 through its FIFO at this rate in Hz (e.g. 200)")
+    ap.add_argument("--scales", type=str, default="",
+                    help="extra window scales in seconds, e.g. 1,10,60 (appended as <col>_<scale>s columns)")
+    ap.add_argument("--window-policy", choices=POLICIES, default="skip",
+                    help="what to do with 3 s windows missed during a stall")
+    args = ap.parse_args()
+
+    if args.replay:
+        source = ReplaySource(args.replay, speed=args.speed)
+    elif args.synthetic:
+        source = SyntheticSource(n_samples=args.synthetic, speed=args.speed)
+    else:
+        source = open_hardware_source(args.align, args.imu_rate)
+        if source is None:
+            exit(1)
+        if source.imu_rate:
+            # The window must hold 3 s of samples at the FIFO rate
+            window_size = int(source.imu_rate * 3)
+            data_window = RollingWindow(window_size)
+    if args.record:
+        source = CaptureRecorder(source, args.record)
+    if args.scales:
+        configure_scales([float(scale) for scale in args.scales.split(',')],
+                         getattr(source, 'imu_rate', None) or 20.0)
+
     try:
-        run_sensor_loop(queue.Queue())
+        run_sensor_loop(queue.Queue(), source, open_telemetry(args.telemetry_format), args.window_policy)
     except KeyboardInterrupt:
         print("Sensor program terminated")
-        ser.close()
+    finally:
+        source.close()